@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Configuration and metadata cache shared by crotalus-rt and crotalus-web
+
+The settings, features settings, channels, stations, volcanoes and the
+feature columns of the continuous table are loaded in a single query, as
+typed records (see crotalus.config.records).
+
+The query also returns a version stamp: the row count and the sum of the
+row versions (xmin) of each table, and the number of columns of the
+continuous table. Any insert, update or delete changes it. The cache checks
+it at most once every `ttl` seconds, which only reads system columns of
+small tables, and reloads everything when it changed.
+
+Derived artifacts (SSAM frequency bands) are computed once per configuration
+version and sampling rate. Filter coefficients are cached by
+`crotalus.dsp.filter.butter_bandpass` itself.
+
+>>> cache = ConfigCache(conn)
+>>> config = cache.get()
+>>> cg, cf = config.general, config.features
+>>> fl, fc, fu = cache.ssam_bands()
+
+"""
+# Python Standard Library
+import time
+
+# Other dependencies
+import pandas as pd
+
+# Local files
+from crotalus.config.records import Config, FeatureConf, GeneralConf
+from crotalus.dsp.spectrum import get_8ve_bands, get_linear_bands
+
+
+_DATA = """
+WITH data AS (
+    SELECT
+        (SELECT row_to_json(s) FROM settings s LIMIT 1) AS settings,
+        (SELECT json_agg(f ORDER BY f.feature_name) FROM feature f) AS feature,
+        (SELECT json_agg(c ORDER BY c.id) FROM channel c) AS channel,
+        (SELECT json_agg(s ORDER BY s.id) FROM station s) AS station,
+        (SELECT json_agg(v ORDER BY v.id) FROM volcano v) AS volcano,
+        (
+            SELECT json_agg(column_name::text ORDER BY ordinal_position)
+            FROM information_schema.columns
+            WHERE table_name = 'continuous'
+        ) AS columns
+)
+"""
+
+_VERSION = """
+concat_ws(
+    '|',
+    (SELECT count(*) || ':' || sum(xmin::text::bigint) FROM settings),
+    (SELECT count(*) || ':' || sum(xmin::text::bigint) FROM feature),
+    (SELECT count(*) || ':' || sum(xmin::text::bigint) FROM channel),
+    (SELECT count(*) || ':' || sum(xmin::text::bigint) FROM station),
+    (SELECT count(*) || ':' || sum(xmin::text::bigint) FROM volcano),
+    (
+        SELECT count(*) FROM pg_attribute
+        WHERE attrelid = to_regclass('continuous') AND
+        attnum > 0 AND NOT attisdropped
+    )
+) AS version
+"""
+
+LOAD_QUERY = _DATA + f"""
+SELECT
+    {_VERSION}, settings, feature, channel, station, volcano, columns
+FROM data;
+"""
+
+VERSION_QUERY = f'SELECT {_VERSION};'
+
+
+def load_config(conn):
+    """ Load the configuration and metadata in a single query
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+
+    Returns
+    -------
+    config : crotalus.config.records.Config
+        Configuration and metadata
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(LOAD_QUERY)
+        version, settings, feature, channel, station, volcano, columns = (
+            c.fetchone()
+        )
+    return Config(
+        version=version,
+        general=GeneralConf.from_dict(settings),
+        features=FeatureConf.from_rows(feature or []),
+        channels=pd.DataFrame(channel or []),
+        stations=pd.DataFrame(station or []),
+        volcanoes=pd.DataFrame(volcano or []),
+        measurements=tuple(
+            column for column in columns or []
+            if column not in ['channel_id', 'time']
+        )
+    )
+
+
+def config_version(conn):
+    """Version stamp of the configuration in the database"""
+    with conn:
+        c = conn.cursor()
+        c.execute(VERSION_QUERY)
+        return c.fetchone()[0]
+
+
+class ConfigCache:
+    """ Configuration reloaded when its version changes
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    ttl : float
+        Seconds between two version checks
+    """
+    def __init__(self, conn, ttl=60):
+        self.conn    = conn
+        self.ttl     = ttl
+        self.config  = load_config(conn)
+        self.checked = time.monotonic()
+        self.derived = {}
+
+    def get(self):
+        """Current configuration, checking its version if `ttl` elapsed"""
+        if time.monotonic() - self.checked >= self.ttl:
+            self.checked = time.monotonic()
+            if config_version(self.conn) != self.config.version:
+                self.reload()
+        return self.config
+
+    def reload(self):
+        self.config  = load_config(self.conn)
+        self.checked = time.monotonic()
+        self.derived = {}
+
+    def _derive(self, key, func):
+        if key not in self.derived:
+            self.derived[key] = func()
+        return self.derived[key]
+
+    def ssam_bands(self, sampling_rate=None):
+        """ SSAM frequency bands, as computed by crotalus-rt
+
+        Octave bands do not depend on the sampling rate.
+
+        Returns
+        -------
+        fl, fc, fu : np.ndarray
+            Lower, center and upper frequencies
+        """
+        c = self.get().features.ssam
+        if c.method == 'linear':
+            return self._derive(
+                ('ssam', None),
+                lambda: get_linear_bands(c.f_lower, c.f_upper, c.f_delta)
+            )
+        return self._derive(
+            ('ssam', sampling_rate),
+            lambda: get_8ve_bands(
+                sampling_rate, c.fraction, c.f_lower, c.f_upper
+            )
+        )
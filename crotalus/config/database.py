@@ -1,17 +1,31 @@
 # Python Standard Library
-from collections import namedtuple
-from datetime import datetime
 
 # Other dependencies
 import pandas as pd
 
 # Local files
+from crotalus.config.records import FEATURE_RECORDS, FeatureConf, GeneralConf
 
 
 def query_general_conf(conn):
-    df = pd.read_sql_query("""SELECT * FROM settings LIMIT 1;""", conn)
-    c = df.iloc[0].to_dict()
-    return namedtuple('c', c.keys())(**c)
+    """ Get the general settings
+
+    To load all the configuration at once, see crotalus.config.cache
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+
+    Returns
+    -------
+    c : GeneralConf
+        General settings
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute('SELECT row_to_json(s) FROM settings s LIMIT 1;')
+        return GeneralConf.from_dict(c.fetchone()[0])
 
 
 def continuous_extraction_channels(conn):
@@ -42,22 +56,23 @@ def get_configuration(feature, conn):
 
     Parameters
     ----------
-    measurement : str
-        Measurement
+    feature : str
+        Feature name
     conn : SQL connection
         SQL connection
 
     Returns
     -------
-    c : namedtuple
-        Configuration settings
+    c : NamedTuple
+        Configuration settings, see crotalus.config.records
     """
-    df = pd.read_sql_query(
-        f"""SELECT * FROM feature
-        WHERE feature_name='{feature}';""",
-        conn)
-    c = df.iloc[0].settings
-    return namedtuple('c', c.keys())(**c)
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            'SELECT settings FROM feature WHERE feature_name = %s;',
+            (feature,)
+        )
+        return FEATURE_RECORDS[feature].from_dict(c.fetchone()[0])
 
 
 def query_feature_conf(conn):
@@ -70,16 +85,13 @@ def query_feature_conf(conn):
 
     Returns
     -------
-    c : namedtuple
+    c : FeatureConf
         Configuration settings
     """
-    df = pd.read_sql_query(
-        f"""SELECT feature_name, settings FROM feature;""",
-        conn)
-    c = dict()
-    for i, row in df.iterrows():
-        c[row.feature_name] = namedtuple(
-            row.feature_name,
-            row.settings.keys()
-        )(**row.settings)
-    return namedtuple('c', c.keys())(**c)
+    with conn:
+        c = conn.cursor()
+        c.execute('SELECT feature_name, settings FROM feature;')
+        return FeatureConf.from_rows(
+            dict(feature_name=name, settings=settings)
+            for name, settings in c.fetchall()
+        )
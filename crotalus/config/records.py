@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Typed configuration records
+
+Settings of the `settings` and `feature` tables as NamedTuple classes defined
+at module level, so they can be pickled (e.g. sent to worker processes).
+
+>>> cg = GeneralConf.from_dict(row)
+>>> cf = FeatureConf.from_rows(rows)
+>>> cf.ssam.fraction
+
+"""
+# Python Standard Library
+from typing import NamedTuple
+
+# Other dependencies
+import pandas as pd
+
+# Local files
+
+
+def _from_dict(cls, d):
+    """Record from a dict, extra keys are ignored and values are cast"""
+    values = {}
+    for field, _type in cls.__annotations__.items():
+        if field not in d:
+            continue
+        value = d[field]
+        values[field] = _type(value) if value is not None else None
+    return cls(**values)
+
+
+class GeneralConf(NamedTuple):
+    window_length: float
+    step: float
+    pad: float
+    decimation_factor: int
+    freqmin: float
+    freqmax: float
+    order: int
+    multiple: float
+
+    from_dict = classmethod(_from_dict)
+
+
+class DSARConf(NamedTuple):
+    freqmin: list
+    freqmax: list
+    order: int
+
+    from_dict = classmethod(_from_dict)
+
+
+class FreqRatioConf(NamedTuple):
+    freqmin: list
+    freqmax: list
+
+    from_dict = classmethod(_from_dict)
+
+
+class FreqTopKConf(NamedTuple):
+    k: int
+
+    from_dict = classmethod(_from_dict)
+
+
+class SSAMConf(NamedTuple):
+    f_lower: float
+    f_upper: float
+    method: str = 'octave'
+    fraction: float = 1/12
+    f_delta: float = 0.25
+
+    from_dict = classmethod(_from_dict)
+
+
+class TonalityConf(NamedTuple):
+    k: int
+    bin_width: float
+
+    from_dict = classmethod(_from_dict)
+
+
+class SpectrogramConf(NamedTuple):
+    window_length: float
+    overlap: float = 0.5
+
+    from_dict = classmethod(_from_dict)
+
+
+FEATURE_RECORDS = dict(
+    dsar=DSARConf,
+    freq_ratio=FreqRatioConf,
+    freq_top_k=FreqTopKConf,
+    ssam=SSAMConf,
+    tonality=TonalityConf,
+    spectrogram=SpectrogramConf
+)
+
+
+class FeatureConf(NamedTuple):
+    dsar: DSARConf
+    freq_ratio: FreqRatioConf
+    freq_top_k: FreqTopKConf
+    ssam: SSAMConf
+    tonality: TonalityConf
+    spectrogram: SpectrogramConf = None # Optional, sub-window spectra
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Features settings from the rows of the feature table
+
+        Parameters
+        ----------
+        rows : iterable of dict
+            With feature_name and settings keys, features without settings
+            are ignored
+        """
+        settings = {
+            row['feature_name']: row['settings'] for row in rows
+            if row['settings'] is not None
+        }
+        return cls(**{
+            name: record.from_dict(settings[name])
+            for name, record in FEATURE_RECORDS.items()
+            if name in settings
+        })
+
+
+class Config(NamedTuple):
+    """ Configuration and metadata, loaded at once
+
+    version : str
+        Stamp of the tables the configuration is loaded from
+    general : GeneralConf
+        General settings
+    features : FeatureConf
+        Features settings
+    channels, stations, volcanoes : pandas.DataFrame
+        Metadata tables
+    measurements : tuple of str
+        Feature columns of the continuous table
+    """
+    version: str
+    general: GeneralConf
+    features: FeatureConf
+    channels: pd.DataFrame
+    stations: pd.DataFrame
+    volcanoes: pd.DataFrame
+    measurements: tuple
+
+    def continuous_extraction_channels(self):
+        """Channels for continuous extraction"""
+        channels = self.channels
+        if len(channels) == 0:
+            return channels
+        return channels[
+            channels.continuous_extraction.astype(bool)
+        ].reset_index(drop=True)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""Columnar export of the continuous table
+
+Streams feature data as Apache Arrow record batches, read from the database
+with a server-side cursor, so memory stays bounded by `batch_size` rows
+whatever the time range.
+
+>>> for batch in read_batches(conn, [1, 2], starttime, endtime):
+>>>     ...
+
+>>> write_ipc(conn, [1, 2], starttime, endtime, 'features.arrow')
+>>> write_parquet(conn, [1, 2], starttime, endtime, 'features/')
+
+SSAM is stored as a variable-size list column, since its number of bands
+follows the configuration and may change over the time range, and is NULL
+where it was not computed.
+
+"""
+# Python Standard Library
+import os
+import uuid
+
+# Other dependencies
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local files
+
+
+BATCH_SIZE = 10000
+
+SCALAR_TYPE = pa.float64()
+
+
+def get_feature_columns(conn):
+    """ Get the feature columns of the continuous table
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+
+    Returns
+    -------
+    columns : list of str
+        Column names, without channel_id and time
+    """
+    with conn.cursor() as c:
+        c.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'continuous'
+            ORDER BY ordinal_position;
+            """
+        )
+        return [
+            row[0] for row in c.fetchall()
+            if row[0] not in ['channel_id', 'time']
+        ]
+
+
+def check_measurements(conn, measurements=None):
+    """ Check the requested feature columns
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    measurements : list of str
+        Feature columns, all of them by default
+
+    Returns
+    -------
+    measurements : list of str
+        Feature columns
+    """
+    available = get_feature_columns(conn)
+    if measurements is None:
+        return available
+    unknown = set(measurements) - set(available)
+    if unknown:
+        raise ValueError(f'Unknown measurements: {", ".join(sorted(unknown))}')
+    return list(measurements)
+
+
+def get_schema(measurements):
+    """ Arrow schema for an export
+
+    Parameters
+    ----------
+    measurements : list of str
+        Feature columns
+
+    Returns
+    -------
+    schema : pyarrow.Schema
+        Schema
+    """
+    fields = [
+        pa.field('channel_id', pa.int32()),
+        pa.field('time', pa.timestamp('us'))
+    ]
+    for m in measurements:
+        if m == 'ssam':
+            fields.append(pa.field(m, pa.list_(SCALAR_TYPE)))
+        elif m == 'ssam_sub':
+            # (n_subwindows, n_bands), NULL without the spectrogram option
+            fields.append(pa.field(m, pa.list_(pa.list_(SCALAR_TYPE))))
+        elif m.endswith('_sub'):
+            fields.append(pa.field(m, pa.list_(SCALAR_TYPE)))
+        else:
+            fields.append(pa.field(m, SCALAR_TYPE))
+    return pa.schema(fields)
+
+
+def read_batches(
+    conn, channel_ids, starttime, endtime, measurements=None,
+    batch_size=BATCH_SIZE
+):
+    """ Read features as Arrow record batches
+
+    Rows are ordered by channel and time.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    channel_ids : list of int
+        Channel IDs
+    starttime : datetime.datetime
+        Start of the time range
+    endtime : datetime.datetime
+        End of the time range
+    measurements : list of str
+        Feature columns, all of them by default
+    batch_size : int
+        Rows per batch
+
+    Yields
+    ------
+    batch : pyarrow.RecordBatch
+        Batch of at most `batch_size` rows
+    """
+    measurements = check_measurements(conn, measurements)
+    columns = ['channel_id', 'time'] + measurements
+
+    schema = get_schema(measurements)
+    with conn:
+        # Named cursor: rows stay on the server until fetched. Unique name,
+        # cursor names are per connection
+        with conn.cursor(name=f'crotalus_export_{uuid.uuid4().hex}') as c:
+            c.itersize = batch_size
+            c.execute(
+                f"""
+                SELECT {', '.join(columns)} FROM continuous
+                WHERE (channel_id = ANY(%s)) AND
+                (time BETWEEN %s AND %s)
+                ORDER BY channel_id, time;
+                """,
+                ([int(i) for i in channel_ids], starttime, endtime)
+            )
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                arrays = [
+                    pa.array([row[i] for row in rows], type=field.type)
+                    for i, field in enumerate(schema)
+                ]
+                yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_ipc(conn, channel_ids, starttime, endtime, measurements=None):
+    """ Arrow IPC stream, chunk by chunk
+
+    To send over HTTP without building the whole stream in memory. The
+    schema is sent first, so an export without rows is still a valid stream.
+    See `read_batches` for the parameters.
+
+    Yields
+    ------
+    chunk : bytes
+        Arrow IPC stream bytes
+    """
+    measurements = check_measurements(conn, measurements)
+    sink = _Chunks()
+    writer = pa.ipc.new_stream(
+        pa.PythonFile(sink, mode='w'), get_schema(measurements)
+    )
+    yield sink.drain()
+    for batch in read_batches(
+        conn, channel_ids, starttime, endtime, measurements
+    ):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def write_ipc(conn, channel_ids, starttime, endtime, path, measurements=None):
+    """ Write an Arrow IPC stream file
+
+    The file always has the schema, even without rows. See `read_batches`
+    for the parameters.
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows written
+    """
+    measurements = check_measurements(conn, measurements)
+    n_rows = 0
+    with open(path, 'wb') as f:
+        writer = pa.ipc.new_stream(f, get_schema(measurements))
+        for batch in read_batches(
+            conn, channel_ids, starttime, endtime, measurements
+        ):
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+        writer.close()
+    return n_rows
+
+
+def write_parquet(
+    conn, channel_ids, starttime, endtime, root, measurements=None
+):
+    """ Write a partitioned Parquet dataset
+
+    Hive partitioning by channel and month:
+        root/channel_id=1/month=2021-01/part-0.parquet
+
+    The partition keys are in the paths only, not in the files, so the
+    dataset reads back with `pyarrow.parquet.read_table(root)`. Rows come
+    ordered by channel and time, so only one file is open at a time. See
+    `read_batches` for the other parameters.
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows written
+    """
+    n_rows, writer, partition = 0, None, None
+    for batch in read_batches(
+        conn, channel_ids, starttime, endtime, measurements
+    ):
+        table = pa.Table.from_batches([batch])
+        keys  = _partition_keys(table)
+        # channel_id is a partition key
+        columns = [name for name in table.column_names if name != 'channel_id']
+        for key in sorted(set(keys)):
+            if key != partition:
+                if writer is not None:
+                    writer.close()
+                channel_id, month = key
+                path = os.path.join(
+                    root, f'channel_id={channel_id}', f'month={month}'
+                )
+                os.makedirs(path, exist_ok=True)
+                writer = pq.ParquetWriter(
+                    os.path.join(path, 'part-0.parquet'),
+                    table.select(columns).schema
+                )
+                partition = key
+            mask = pa.array([k == key for k in keys])
+            part = table.filter(mask).select(columns)
+            writer.write_table(part)
+            n_rows += part.num_rows
+    if writer is not None:
+        writer.close()
+    return n_rows
+
+
+def _partition_keys(table):
+    channel_ids = table.column('channel_id').to_pylist()
+    times       = table.column('time').to_pylist()
+    return [
+        (channel_id, f'{t.year}-{t.month:02d}')
+        for channel_id, t in zip(channel_ids, times)
+    ]
+
+
+class _Chunks:
+    """Write-only file object that hands out what was written since last time"""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""Schema management for the continuous table
+
+The continuous table is partitioned by time range, one partition per month:
+
+    continuous
+    ├── continuous_y2021m01
+    ├── continuous_y2021m02
+    └── ...
+
+Each partition gets a unique b-tree index on (channel_id, time), used by the
+per-channel range queries of the web interface, and a BRIN index on time,
+which is tiny and good for whole-network time scans, since rows are written
+in time order.
+
+Inserts and range scans only touch the partitions of the requested months,
+so their cost does not grow with the history length.
+
+>>> create_continuous(conn)
+>>> maintain(conn, months_ahead=3, retention_months=None, compact_after=2)
+
+"""
+# Python Standard Library
+from datetime import datetime
+import logging
+
+# Other dependencies
+
+# Local files
+
+
+TABLE = 'continuous'
+
+COLUMNS = """
+    channel_id    integer NOT NULL,
+    time          timestamp NOT NULL,
+    rsem          double precision,
+    ssam          double precision[],
+    dsar          double precision,
+    freq_domi     double precision,
+    freq_top_k    double precision,
+    freq_central  double precision,
+    freq_centroid double precision,
+    kurtosis      double precision,
+    tonality      double precision,
+    freq_ratio    double precision
+"""
+
+COLUMN_NAMES = [line.split()[0] for line in COLUMNS.strip().splitlines()]
+
+# Per sub-window features (spectrogram option), added to existing tables
+SUBWINDOW_COLUMNS = [
+    ('ssam_sub', 'double precision[]'), # (n_subwindows, n_bands)
+    ('freq_domi_sub', 'double precision[]'),
+    ('freq_centroid_sub', 'double precision[]')
+]
+
+
+def partition_name(year, month):
+    return f'{TABLE}_y{year:04d}m{month:02d}'
+
+
+def month_bounds(year, month):
+    """First instant of the month and of the next one"""
+    start = datetime(year, month, 1)
+    if month == 12:
+        return start, datetime(year + 1, 1, 1)
+    return start, datetime(year, month + 1, 1)
+
+
+def add_months(year, month, n):
+    i = year * 12 + (month - 1) + n
+    return i // 12, i % 12 + 1
+
+
+def create_continuous(conn):
+    """ Create the partitioned continuous table if it does not exist
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {TABLE} ({COLUMNS})
+            PARTITION BY RANGE (time);
+            """
+        )
+    add_subwindow_columns(conn)
+
+
+def add_subwindow_columns(conn):
+    """ Add the per sub-window feature columns if they do not exist
+
+    Added to the partitioned table, so to all its partitions. ALTER TABLE
+    locks the table and all its partitions, even when the columns exist, so
+    it only runs for the missing columns.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = %s;
+            """,
+            (TABLE,)
+        )
+        existing = {row[0] for row in c.fetchall()}
+        for name, _type in SUBWINDOW_COLUMNS:
+            if name not in existing:
+                c.execute(
+                    f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS '
+                    f'{name} {_type};'
+                )
+
+
+def create_partition(conn, year, month):
+    """ Create a monthly partition and its indexes if it does not exist
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    year : int
+        Year
+    month : int
+        Month
+
+    Returns
+    -------
+    name : str
+        Partition name
+    """
+    name = partition_name(year, month)
+    start, end = month_bounds(year, month)
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {name}
+            PARTITION OF {TABLE}
+            FOR VALUES FROM (%s) TO (%s);
+            """,
+            (start, end)
+        )
+        c.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {name}_channel_id_time_idx
+            ON {name} (channel_id, time);
+            """
+        )
+        c.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {name}_time_brin_idx
+            ON {name} USING BRIN (time);
+            """
+        )
+    return name
+
+
+def is_partitioned(conn):
+    """ Whether the continuous table exists and is partitioned
+
+    Tables created before partitioning are plain tables, convert them with
+    `migrate_continuous` (crotalus-schema migrate).
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+
+    Returns
+    -------
+    partitioned : bool or None
+        None if the table does not exist
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT relkind FROM pg_class
+            WHERE relname = %s AND relkind IN ('r', 'p');
+            """,
+            (TABLE,)
+        )
+        row = c.fetchone()
+    if row is None:
+        return None
+    return row[0] == 'p'
+
+
+def has_unique_index(conn):
+    """ Whether the continuous table deduplicates rows on (channel_id, time)
+
+    Partitions always have the unique index. Plain tables created before
+    partitioning may not, then writing a window twice duplicates its row.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+
+    Returns
+    -------
+    unique : bool
+    """
+    if is_partitioned(conn):
+        return True
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT count(*) FROM pg_index
+            JOIN pg_class ON pg_index.indrelid = pg_class.oid
+            WHERE pg_class.relname = %s AND pg_index.indisunique AND
+            pg_index.indnatts = 2 AND (
+                SELECT array_agg(attname::text ORDER BY attname::text)
+                FROM pg_attribute
+                WHERE attrelid = pg_class.oid AND
+                attnum = ANY(pg_index.indkey)
+            ) = ARRAY['channel_id', 'time'];
+            """,
+            (TABLE,)
+        )
+        return c.fetchone()[0] > 0
+
+
+def list_partitions(conn):
+    """ Get the existing partitions
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+
+    Returns
+    -------
+    partitions : list of tuple
+        (year, month) of each partition, sorted
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child  ON pg_inherits.inhrelid  = child.oid
+            WHERE parent.relname = %s;
+            """,
+            (TABLE,)
+        )
+        names = [row[0] for row in c.fetchall()]
+
+    partitions = []
+    prefix = f'{TABLE}_y'
+    for name in names:
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split('m')
+            partitions.append((int(year), int(month)))
+    return sorted(partitions)
+
+
+def ensure_partitions(conn, months_ahead=3, now=None):
+    """ Create the partitions from the current month to `months_ahead`
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    months_ahead : int
+        Number of future months
+    now : datetime.datetime
+        Current time, defaults to UTC now
+    """
+    now = now or datetime.utcnow()
+    for n in range(months_ahead + 1):
+        create_partition(conn, *add_months(now.year, now.month, n))
+
+
+def create_partitions(conn, starttime, endtime):
+    """ Create the partitions of every month between two times
+
+    For writes into past months, e.g. backfills
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    starttime, endtime : datetime.datetime
+        Time range
+    """
+    year, month = starttime.year, starttime.month
+    while (year, month) <= (endtime.year, endtime.month):
+        create_partition(conn, year, month)
+        year, month = add_months(year, month, 1)
+
+
+def drop_old_partitions(conn, retention_months, now=None):
+    """ Drop the partitions older than the retention period
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    retention_months : int
+        Number of past months to keep, besides the current one
+    now : datetime.datetime
+        Current time, defaults to UTC now
+
+    Returns
+    -------
+    dropped : list of str
+        Dropped partitions
+    """
+    now = now or datetime.utcnow()
+    oldest = add_months(now.year, now.month, -retention_months)
+    dropped = []
+    for year, month in list_partitions(conn):
+        if (year, month) < oldest:
+            name = partition_name(year, month)
+            with conn:
+                c = conn.cursor()
+                c.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name};')
+                c.execute(f'DROP TABLE {name};')
+            dropped.append(name)
+    return dropped
+
+
+def is_compacted(conn, year, month):
+    """Whether the partition was already clustered by `compact_partition`"""
+    name = partition_name(year, month)
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT indisclustered FROM pg_index
+            JOIN pg_class ON pg_index.indexrelid = pg_class.oid
+            WHERE pg_class.relname = %s;
+            """,
+            (f'{name}_channel_id_time_idx',)
+        )
+        row = c.fetchone()
+    return row is not None and row[0]
+
+
+def compact_partition(conn, year, month):
+    """ Compact a closed partition
+
+    Rewrites the partition ordered by (channel_id, time), so the rows of a
+    channel are contiguous on disk and dead space is reclaimed, then freezes
+    it. Only for months that are no longer written, it locks the partition.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    year : int
+        Year
+    month : int
+        Month
+    """
+    name = partition_name(year, month)
+    with conn:
+        c = conn.cursor()
+        c.execute(f'CLUSTER {name} USING {name}_channel_id_time_idx;')
+
+    # VACUUM cannot run inside a transaction
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        c = conn.cursor()
+        c.execute(f'VACUUM (FREEZE, ANALYZE) {name};')
+    finally:
+        conn.autocommit = autocommit
+
+
+def migrate_continuous(conn):
+    """ Convert an existing plain continuous table into a partitioned one
+
+    The old table is renamed to continuous_old, the new partitioned table is
+    created with partitions covering its data and the rows are copied, with
+    the sub-window columns the old table has. Duplicated (channel_id, time)
+    rows are skipped. The old table is kept.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    """
+    if is_partitioned(conn) in (None, True):
+        create_continuous(conn)
+        return
+
+    with conn:
+        c = conn.cursor()
+        c.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_old;')
+        c.execute(f'SELECT min(time), max(time) FROM {TABLE}_old;')
+        tmin, tmax = c.fetchone()
+
+        # Sub-window columns the plain table may already have
+        c.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = %s;
+            """,
+            (f'{TABLE}_old',)
+        )
+        existing = {row[0] for row in c.fetchall()}
+
+    create_continuous(conn)
+    if tmin is not None:
+        create_partitions(conn, tmin, tmax)
+
+    columns = ', '.join(
+        COLUMN_NAMES +
+        [name for name, _type in SUBWINDOW_COLUMNS if name in existing]
+    )
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            f"""
+            INSERT INTO {TABLE} ({columns})
+            SELECT {columns} FROM {TABLE}_old
+            ON CONFLICT DO NOTHING;
+            """
+        )
+
+
+def maintain(
+    conn, months_ahead=3, retention_months=None, compact_after=None,
+    now=None
+):
+    """ Periodic maintenance of the continuous table
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    months_ahead : int
+        Future partitions to create
+    retention_months : int or None
+        Drop partitions older than this number of months, None to keep all
+    compact_after : int or None
+        Compact partitions this number of months old, None to skip. Every
+        partition is compacted once, when it reaches this age
+    now : datetime.datetime
+        Current time, defaults to UTC now
+    """
+    now = now or datetime.utcnow()
+
+    ensure_partitions(conn, months_ahead, now)
+
+    if retention_months is not None:
+        for name in drop_old_partitions(conn, retention_months, now):
+            logging.info(f'Dropped partition {name}')
+
+    if compact_after is not None:
+        year, month = add_months(now.year, now.month, -compact_after)
+        if ((year, month) in list_partitions(conn) and
+                not is_compacted(conn, year, month)):
+            logging.info(f'Compacting {partition_name(year, month)}...')
+            compact_partition(conn, year, month)
@@ -89,14 +89,16 @@ def dsar(tr, freqmin, freqmax, order, window_length, overlap):
 
     Returns
     -------
-    utcdatetimes : array of obspy.UTCDateTime objects
+    times : array of numpy.datetime64
         Time for each data point
     dsar : np.array
         DSAR data
     """
+    dtype = tr.data.dtype
     tr.integrate()
     tr.detrend()
     tr.filter('highpass', freq=0.5) # To avoid oceanic contamination
+    tr.data = tr.data.astype(dtype, copy=False) # Keep float32 if given
 
     tr_LF = tr.copy()
     tr_HF = tr.copy()
@@ -107,12 +109,12 @@ def dsar(tr, freqmin, freqmax, order, window_length, overlap):
         butter_bandpass_filter(tr, freqmin[i], freqmax[i], order)
         st += tr
 
-    utcdatetimes, data_windowed = st2windowed_data(st, window_length, overlap)
+    times, data_windowed = st2windowed_data(st, window_length, overlap)
 
     data_windowed = np.median(np.abs(data_windowed), axis=2)
 
     DSAR = data_windowed[0]/data_windowed[1]
-    return utcdatetimes, DSAR
+    return times, DSAR
 
 
 def freq_domi(f, Sx, k):
@@ -229,7 +231,7 @@ def tonality(f, Sx, k, bin_width, sampling_rate):
             right_pad = right - len(Sx) + 1
             right = len(Sx) - 1
 
-        Sx_slice = np.zeros(_bin_width, dtype=np.float64)
+        Sx_slice = np.zeros(_bin_width, dtype=Sx.dtype)
 
         Sx_slice[left_pad:left_pad+right-left] = Sx[left:right]
 
@@ -1,14 +1,33 @@
+from functools import lru_cache
+
 import numpy as np
 from obspy import Stream, Trace
 from scipy.signal import butter, lfilter
 
 
+@lru_cache(maxsize=None)
+def butter_bandpass(freqmin, freqmax, order, sampling_rate):
+    """Butterworth bandpass coefficients, computed once per set of arguments
+
+    Returns
+    -------
+    b, a : np.ndarray
+        Read-only transfer function coefficients
+    """
+    nyquist = .5 * sampling_rate
+    b, a    = butter(order, [freqmin / nyquist, freqmax / nyquist], btype='band')
+    b.flags.writeable = False
+    a.flags.writeable = False
+    return b, a
+
+
 def _butter_bandpass_filter(tr, freqmin, freqmax, order):
     """Filter a obspy Trace with a Butterworth filter
 
     Relies on scipy.signal butter and lfilter functions
     Detrending must be performed calling this function.
     This functions alter permanently the Trace data
+    The filter runs in double precision, the data type of the Trace is kept
 
     Parameters
     ----------
@@ -24,11 +43,14 @@ def _butter_bandpass_filter(tr, freqmin, freqmax, order):
     Returns
     -------
     """
-    nyquist = .5 * tr.stats.sampling_rate
-    low     = freqmin / nyquist
-    high    = freqmax / nyquist
-    b, a    = butter(order, [low, high], btype='band')
-    tr.data = lfilter(b, a, tr.data)
+    b, a    = butter_bandpass(
+        float(freqmin), float(freqmax), int(order),
+        float(tr.stats.sampling_rate)
+    )
+    data    = lfilter(b, a, tr.data)
+    if np.issubdtype(tr.data.dtype, np.floating):
+        data = data.astype(tr.data.dtype, copy=False)
+    tr.data = data
     return
 
 
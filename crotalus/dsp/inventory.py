@@ -1,3 +1,11 @@
+# Python Standard Library
+
+# Other dependencies
+import numpy as np
+
+# Local files
+
+
 
 
 def get_instrument_scale(inventory, station, channel, time):
@@ -30,3 +38,37 @@ def get_instrument_scale(inventory, station, channel, time):
     value = instrument_sensitivity.value
     input_units = instrument_sensitivity.input_units
     return value, input_units
+
+
+def get_response_deviation(inventory, station, channel, time, frequencies):
+    """Get the deviation of the response from its sensitivity
+
+    Dividing by the sensitivity only removes the response where it is flat,
+    e.g. not near the corner frequency of short period sensors
+
+    Parameters
+    ----------
+    inventory : obspy.inventory
+        Inventory containing instrument response
+    station : str
+        Station code
+    channel : str
+        Channel code
+    time : obspy.UTCDateTime
+        Time where the instrument is active
+    frequencies : list of float
+        Frequencies to check, e.g. the bandpass corners
+
+    Returns
+    -------
+    deviation : np.ndarray
+        Relative deviation of the velocity response amplitude from the
+        sensitivity, at each frequency
+
+    """
+    channel = inventory.select(station=station, channel=channel, time=time)[0][0][0]
+    response = channel.response
+    amplitude = np.abs(response.get_evalresp_response_for_frequencies(
+        np.asarray(frequencies, dtype=float), output='VEL'
+    ))
+    return np.abs(amplitude / response.instrument_sensitivity.value - 1)
@@ -8,23 +8,86 @@ This module offers a function to replace the for loop:
 This for loop is easy and intuitive to use but slow for large dataset
 
 Instead use:
->>> utcdatetime, data_windowed = st2windowed_data(st, window_length, overlap)
+>>> times, data_windowed = st2windowed_data(st, window_length, overlap)
 
-utcdatetime contains the UTCDateTime object for each window center
+times contains the numpy.datetime64 of each window center
 data_windowed is an array with shape: (n_traces, n_windows, window_pts)
 
+For arrays too large to stack, iterate over the windows:
+>>> for time, window in iter_windowed_data(st, window_length, overlap):
+>>>        window...
+
+window is an array with shape: (n_traces, window_pts)
+
+The windows of st2windowed_data are read-only views, copy them before
+modifying them in place.
+
 """
+# Python Standard Library
+from fractions import Fraction
+
+# Other dependencies
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from obspy import Stream, Trace
-from obspy.core.util.misc import get_window_times
-from skimage.util.shape import view_as_windows
+from scipy.signal import resample_poly
+
+
+def _common_arrays(st):
+    """Trace data over the common time span, at the highest sampling rate
+
+    Traces already at that rate are returned as views of their data, the
+    others are resampled.
+    """
+    if isinstance(st, Trace):
+        st = Stream(traces=[st])
+
+    sampling_rate = max(tr.stats.sampling_rate for tr in st)
+    starttime     = max(tr.stats.starttime for tr in st)
+    endtime       = min(tr.stats.endtime for tr in st)
+
+    arrays = []
+    for tr in st:
+        sr = tr.stats.sampling_rate
+        i0 = int(round((starttime - tr.stats.starttime) * sr))
+        i1 = int(round((endtime - tr.stats.starttime) * sr)) + 1
+        data = tr.data[i0:i1]
+        if sr != sampling_rate:
+            ratio = Fraction(sampling_rate / sr).limit_denominator(1000)
+            data = resample_poly(
+                data, ratio.numerator, ratio.denominator
+            ).astype(data.dtype, copy=False)
+        arrays.append(data)
+
+    npts = min(len(data) for data in arrays)
+    arrays = [data[:npts] for data in arrays]
+    return starttime, sampling_rate, arrays
+
+
+def _window_params(window_length, overlap, sampling_rate, npts):
+    window_pts  = int(round(window_length * sampling_rate))
+    overlap_pts = int(round(window_pts * overlap))
+    step        = window_pts - overlap_pts
+    n_windows   = max(0, (npts - window_pts) // step + 1)
+    return window_pts, step, n_windows
+
+
+def _window_times(starttime, sampling_rate, window_pts, step, n_windows):
+    offsets = (np.arange(n_windows) * step + window_pts / 2) / sampling_rate
+    return (
+        np.datetime64(starttime.ns, 'ns') +
+        np.round(offsets * 1e9).astype('timedelta64[ns]')
+    )
 
 
 def st2windowed_data(st, window_length, overlap):
     """Creates overlapping windowed data from obspy Stream object
 
-    Depends on skimage.util.shape.view_as_windows
-    You can pass either a Trace or a Stream
+    You can pass either a Trace or a Stream. The Stream is not modified.
+    Traces are cut to their common time span; traces with a lower sampling
+    rate are resampled to the highest one.
+    For a single trace at the highest rate the result is a view of the trace
+    data, otherwise the traces are copied once into a 2D array.
 
     Parameters
     ----------
@@ -39,52 +102,69 @@ def st2windowed_data(st, window_length, overlap):
     Returns
     -------
     time : np 1D array
-        Contains the UTCDateTime object for each window center
+        numpy.datetime64 of each window center
     data_windowed : np ndarray
-        Array with shape: (n_traces, n_windows, window_pts)
+        Read-only array with shape: (n_traces, n_windows, window_pts)
 
     """
-    if isinstance(st, Trace):
-        st = Stream(traces=[st])
-
-    # TODO check that all traces have same sampling rate, if not, upsample to
-    # the maximum
+    starttime, sampling_rate, arrays = _common_arrays(st)
 
-    starttimes = [tr.stats.starttime for tr in st]
-    endtimes = [tr.stats.endtime for tr in st]
-    st.trim(starttime=max(starttimes), endtime=min(endtimes))
-
-    utcdatetime = get_window_times(
-        st[0].stats.starttime,
-        st[0].stats.endtime,
-        window_length=window_length,
-        step=window_length - window_length*overlap,
-        offset=0,
-        include_partial_windows=False
+    window_pts, step, n_windows = _window_params(
+        window_length, overlap, sampling_rate, len(arrays[0])
+    )
+    times = _window_times(
+        starttime, sampling_rate, window_pts, step, n_windows
     )
 
-    utcdatetime = (np.array(utcdatetime)[:, :1]+window_length/2).flatten()
+    if n_windows == 0:
+        dtype = np.result_type(*arrays)
+        return times, np.empty((len(arrays), 0, window_pts), dtype=dtype)
 
     # Stream -> array of shape: (n_traces, npts)
-    n_traces = len(st)
-    data = np.array([tr.data for tr in st])
+    if len(arrays) == 1:
+        data = arrays[0][np.newaxis]
+    else:
+        data = np.stack(arrays)
 
-    # Convert to point units
-    window_pts  = int(window_length * st[0].stats.sampling_rate)
-    overlap_pts = int(window_pts * overlap)
-    step        = window_pts - overlap_pts
+    data_windowed = sliding_window_view(data, window_pts, axis=-1)
+    data_windowed = data_windowed[:, ::step][:, :n_windows]
 
-    # Get number of total complete windows
-    window_ends_idx = np.arange(window_pts - 1, data.shape[1], step)
-    n_windows = len(window_ends_idx)
+    return times, data_windowed
 
-    # Trim to fit number of complete windows
-    data = data[:, :window_ends_idx[-1]+1]
 
-    data_windowed = view_as_windows(
-        arr_in=data, window_shape=(n_traces, window_pts), step=step
-    )[0]
+def iter_windowed_data(st, window_length, overlap):
+    """Iterates over the windows of an obspy Stream object
 
-    data_windowed = np.transpose(data_windowed, axes=[1, 0, 2])
+    Same as `st2windowed_data`, one window at a time, without stacking the
+    traces into a single array.
+
+    Parameters
+    ----------
+    st : obspy Stream or Trace object
+        Stream with n number of traces (n_traces),
+        also a single Trace can be given
+    window_length : int
+        Window length in seconds
+    overlap : float
+        Window percentage of overlap, float form 0 to 1
+
+    Yields
+    ------
+    time : numpy.datetime64
+        Window center
+    window : np ndarray
+        Array with shape: (n_traces, window_pts)
+
+    """
+    starttime, sampling_rate, arrays = _common_arrays(st)
+
+    window_pts, step, n_windows = _window_params(
+        window_length, overlap, sampling_rate, len(arrays[0])
+    )
+    times = _window_times(
+        starttime, sampling_rate, window_pts, step, n_windows
+    )
 
-    return utcdatetime, data_windowed
+    for i, time in enumerate(times):
+        i0 = i * step
+        yield time, np.stack([data[i0:i0+window_pts] for data in arrays])
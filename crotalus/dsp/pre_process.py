@@ -1,6 +1,7 @@
 # Python Standard Library
 
 # Other dependencies
+import numpy as np
 from obspy import Stream, Trace
 from scipy.signal.windows import tukey
 
@@ -8,24 +9,42 @@ from scipy.signal.windows import tukey
 from crotalus.dsp.filter import butter_bandpass_filter
 
 
-def _pre_process(tr, decimation_factor, freqmin, freqmax, order, multiple):
+def _pre_process(
+    tr, decimation_factor, freqmin, freqmax, order, multiple, dtype
+):
+    tr.data = tr.data.astype(dtype, copy=False)
     tr.detrend()
     if decimation_factor != 1:
         tr.decimate(decimation_factor)
+    tr.data = tr.data.astype(dtype, copy=False) # obspy may upcast
     tr.data *= multiple
     butter_bandpass_filter(tr, freqmin, freqmax, order)
 
 
-def pre_process(st, decimation_factor, freqmin, freqmax, order, multiple):
+def pre_process(
+    st, decimation_factor, freqmin, freqmax, order, multiple,
+    dtype=np.float64
+):
+    """Merge, remove response, detrend, decimate, scale and filter
+
+    Modifies the Stream or Trace in place.
+
+    With dtype=np.float32 the data is returned in single precision: FFTs,
+    spectra and SSAM follow the data type, halving memory. Response removal,
+    decimation and filtering still compute in double precision, each step
+    converts back to float32 afterwards.
+    """
     st.merge()
     st.remove_response()
 
     if isinstance(st, Trace):
-        _pre_process(st, decimation_factor, freqmin, freqmax, order, multiple)
+        _pre_process(
+            st, decimation_factor, freqmin, freqmax, order, multiple, dtype
+        )
     elif isinstance(st, Stream):
         for tr in st:
             _pre_process(
-                tr, decimation_factor, freqmin, freqmax, order, multiple
+                tr, decimation_factor, freqmin, freqmax, order, multiple, dtype
             )
 
 
@@ -1,4 +1,5 @@
 # Python Standard Library
+from functools import lru_cache
 
 # Other dependencies
 import numpy as np
@@ -6,13 +7,21 @@ from scipy.fft import rfft
 from scipy.signal.windows import tukey
 
 # Local files
+from crotalus.dsp.obspy2numpy import st2windowed_data
 
 
+def _read_only(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
 
+
+@lru_cache(maxsize=None)
 def get_linear_bands(f_lower, f_upper, f_delta):
     """ Get linear frequency spectrum bands
 
-    To downsample spectrum
+    To downsample spectrum. Computed once per set of arguments, the arrays
+    are read-only
 
     Parameters
     ----------
@@ -35,13 +44,15 @@ def get_linear_bands(f_lower, f_upper, f_delta):
     fl = np.arange(f_lower, f_upper, f_delta)
     fu = np.arange(f_lower+f_delta, f_upper+f_delta, f_delta)
     fc = (fl + fu)/2
-    return fl, fc, fu
+    return _read_only(fl, fc, fu)
 
 
+@lru_cache(maxsize=None)
 def get_8ve_bands(sampling_rate, fraction, f_lower, f_upper):
     """ Get octave frequency spectrum bands
 
-    For better resolution in low frequency
+    For better resolution in low frequency. Computed once per set of
+    arguments, the arrays are read-only
 
     Parameters
     ----------
@@ -69,7 +80,7 @@ def get_8ve_bands(sampling_rate, fraction, f_lower, f_upper):
     fc = f_lower*2**(np.arange(bmax)*fraction)
     fl = fc*2**(-fraction/2)
     fu = fc*2**(+fraction/2)
-    return fl, fc, fu
+    return _read_only(fl, fc, fu)
 
 
 def spectrum(tr, pad):
@@ -101,7 +112,7 @@ def spectrogram(tr, window_length, overlap, pad,):
 
     Returns
     -------
-    utcdatetimes : array of obspy.UTCDateTime objects
+    times : array of numpy.datetime64
         Time for each data point
     f : np.ndarray
         Frequency (1d) array
@@ -109,15 +120,18 @@ def spectrogram(tr, window_length, overlap, pad,):
         SSAM matrix or matrices
 
     """
-    utcdatetimes, data_windowed = st2windowed_data(tr, window_length, overlap)
+    times, data_windowed = st2windowed_data(tr, window_length, overlap)
     data_windowed = data_windowed[0]
 
-    data_windowed *= tukey(data_windowed.shape[1], alpha=pad) # taper
+    # Not in place: windows are overlapping views of the trace
+    data_windowed = data_windowed * tukey(
+        data_windowed.shape[1], alpha=pad
+    ).astype(data_windowed.dtype) # taper
 
     Sxx = np.abs(rfft(data_windowed))
 
     f = np.fft.rfftfreq(data_windowed.shape[1], tr.stats.delta)
-    return utcdatetimes, f, Sxx
+    return times, f, Sxx
 
 
 def downsample_spectrogram(
@@ -159,16 +173,16 @@ def downsample_spectrogram(
         fl, fc, fu = get_linear_bands(f_lower, f_upper, f_delta)
 
     if Sx.ndim == 1:
-        ssam = np.empty(len(fl))
+        ssam = np.empty(len(fl), dtype=Sx.dtype)
         for i in range(len(fl)):
             freq_min_idx = (np.abs(f - fl[i])).argmin()
             freq_max_idx = (np.abs(f - fu[i])).argmin()
             ssam[i] = Sx[freq_min_idx:freq_max_idx+1].mean()
     elif Sx.ndim == 2:
         Sxx = Sx
-        ssam = np.empty((Sxx.shape[0], len(fl)))
+        ssam = np.empty((Sxx.shape[0], len(fl)), dtype=Sxx.dtype)
         for i in range(len(fl)):
             freq_min_idx = (np.abs(f - fl[i])).argmin()
             freq_max_idx = (np.abs(f - fu[i])).argmin()
-            ssam[:, i] = Sxx[:, freq_min_idx:freq_max_idx].mean(axis=1)
+            ssam[:, i] = Sxx[:, freq_min_idx:freq_max_idx+1].mean(axis=1)
     return fc, ssam
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""Chunked streaming processing of long traces with bounded memory
+
+Long traces (days to months) are read in chunks and processed as a stream:
+
+    chunks -> pre-processing -> windows -> features -> writer
+
+Every stateful step keeps its state between chunks:
+    - IIR filters carry their internal state (`zi`), so filtering chunk by
+      chunk gives the same result as filtering the whole trace at once
+    - the windower keeps the samples of the window spanning two chunks
+    - decimation keeps the phase of the kept samples
+
+so the output does not depend on the chunk length, and memory only depends
+on the chunk and window lengths.
+
+Steps that need the whole trace have streaming equivalents:
+    - response removal divides by the instrument sensitivity
+      (see `crotalus.dsp.inventory.get_instrument_scale`)
+    - no detrend, the bandpass filter removes the mean and the trends
+    - decimation uses a causal Chebyshev type I anti-alias filter
+
+A gap between chunks resets the filters and the windows, as a new trace.
+The filters restart in the steady state of the first sample of the segment,
+so the DC offset does not ring, and the first `SETTLE_CYCLES` periods of
+`freqmin` after a gap are dropped, so no window contains the filter
+transient.
+
+Feature values are therefore close to the ones of crotalus-rt, which
+detrends and filters each window on its own with its full response removed,
+but not identical, as for catch-up (see crotalus.rt.catchup).
+
+>>> chunks = iter_client_chunks(client, 'OV', 'VTUN', '*', 'HHZ', t0, t1, 3600)
+>>> for window in stream_windows(chunks, cg, sensitivity):
+>>>     ...
+
+See crotalus.rt.backfill for the features and the writer.
+
+"""
+# Python Standard Library
+import logging
+import time
+
+# Other dependencies
+import numpy as np
+from obspy import Trace, read
+from obspy.clients.fdsn.header import FDSNNoDataException
+from scipy.signal import (
+    butter, cheby1, lfilter, lfilter_zi, sosfilt, sosfilt_zi
+)
+
+# Local files
+
+
+SETTLE_CYCLES = 3 # Periods of freqmin dropped after a reset
+
+
+class StreamingFilter:
+    """ IIR filter keeping its state between chunks
+
+    Filtering chunk by chunk is equivalent to filtering the concatenated data
+    with scipy.signal.lfilter (or sosfilt) starting from rest.
+
+    Parameters
+    ----------
+    b, a : np.ndarray
+        Transfer function coefficients
+    sos : np.ndarray
+        Second-order sections, instead of b and a
+    """
+    def __init__(self, b=None, a=None, sos=None):
+        self.b, self.a, self.sos = b, a, sos
+        self.reset()
+
+    def reset(self, x0=0.):
+        """Restart in the steady state of a constant input `x0`"""
+        if self.sos is not None:
+            self.zi = sosfilt_zi(self.sos) * x0
+        else:
+            self.zi = lfilter_zi(self.b, self.a) * x0
+
+    def __call__(self, data):
+        if self.sos is not None:
+            y, self.zi = sosfilt(self.sos, data, zi=self.zi)
+        else:
+            y, self.zi = lfilter(self.b, self.a, data, zi=self.zi)
+        return y
+
+
+class StreamingDecimator:
+    """ Causal anti-alias filter and decimation keeping its phase
+
+    Parameters
+    ----------
+    factor : int
+        Decimation factor
+    """
+    def __init__(self, factor):
+        self.factor = factor
+        b, a = cheby1(8, 0.05, 0.8 / factor)
+        self.filter = StreamingFilter(b, a)
+        self.reset()
+
+    def reset(self, x0=0.):
+        self.filter.reset(x0)
+        self.offset = 0 # Index in the next chunk of the next kept sample
+
+    def __call__(self, data):
+        y = self.filter(data)[self.offset::self.factor]
+        self.offset = (self.offset - len(data)) % self.factor
+        return y
+
+
+class Windower:
+    """ Complete windows from a stream of samples
+
+    Parameters
+    ----------
+    window_pts : int
+        Window length in samples
+    step : int
+        Step between windows in samples
+    """
+    def __init__(self, window_pts, step):
+        self.window_pts = window_pts
+        self.step       = step
+        self.reset(None)
+
+    def reset(self, starttime, skip=0):
+        """ Start a new segment
+
+        Parameters
+        ----------
+        starttime : obspy.UTCDateTime
+            Start of the first window
+        skip : int
+            Samples of the segment before `starttime`, dropped
+        """
+        self.buffer    = np.empty(0)
+        self.starttime = starttime # Time of the first sample in the buffer
+        self.skip      = skip
+
+    def __call__(self, data, sampling_rate):
+        """ Push samples
+
+        Returns
+        -------
+        starttimes : list of obspy.UTCDateTime
+            Start time of each complete window
+        windows : np.ndarray
+            Windows with shape (n_windows, window_pts), copies
+        """
+        skip, self.skip = min(self.skip, len(data)), max(self.skip - len(data), 0)
+        data   = data[skip:]
+        buffer = np.concatenate([self.buffer, data]).astype(data.dtype)
+        n_windows = max(0, (len(buffer) - self.window_pts) // self.step + 1)
+
+        starttimes = [
+            self.starttime + i * self.step / sampling_rate
+            for i in range(n_windows)
+        ]
+        windows = np.stack([
+            buffer[i*self.step:i*self.step+self.window_pts]
+            for i in range(n_windows)
+        ]) if n_windows else np.empty((0, self.window_pts), buffer.dtype)
+
+        # Keep from the start of the next window
+        consumed = n_windows * self.step
+        self.buffer = buffer[consumed:].copy()
+        self.starttime += consumed / sampling_rate
+        return starttimes, windows
+
+
+def iter_client_chunks(
+    client, network, station, location, channel, starttime, endtime,
+    chunk_length, retries=3, retry_wait=10
+):
+    """ Read a long trace from a FDSN client in chunks
+
+    Chunks without data are gaps. Other errors are retried, a chunk still
+    failing after `retries` attempts raises, so a failure is never written
+    as a gap.
+
+    Parameters
+    ----------
+    client : obspy.clients.fdsn.Client
+        FDSN client
+    network, station, location, channel : str
+        Channel codes
+    starttime, endtime : obspy.UTCDateTime
+        Time range
+    chunk_length : float
+        Chunk length in seconds
+    retries : int
+        Attempts per chunk
+    retry_wait : float
+        Seconds between two attempts
+
+    Yields
+    ------
+    tr : obspy.Trace
+        Contiguous piece of data, there may be gaps between them
+    """
+    t = starttime
+    while t < endtime:
+        t1 = min(t + chunk_length, endtime)
+        for attempt in range(1, retries + 1):
+            try:
+                st = client.get_waveforms(
+                    network, station, location, channel, t, t1
+                )
+                break
+            except FDSNNoDataException:
+                logging.info(f'No data for {station}-{channel} {t}-{t1}')
+                st = []
+                break
+            except Exception as e:
+                logging.warning(
+                    f'Failed to get {station}-{channel} {t}-{t1} '
+                    f'(attempt {attempt}/{retries}): {e}'
+                )
+                if attempt == retries:
+                    raise
+                time.sleep(retry_wait)
+        # Chunk boundaries are shared, drop the last sample
+        for tr in sorted(st, key=lambda tr: tr.stats.starttime):
+            tr = tr.slice(t, t1 - tr.stats.delta / 2)
+            if tr.stats.npts:
+                yield tr
+        t = t1
+
+
+def iter_file_chunks(paths):
+    """ Read a long trace from files, one file at a time
+
+    Parameters
+    ----------
+    paths : list of str
+        Files sorted in time, e.g. SDS daily files of one channel
+
+    Yields
+    ------
+    tr : obspy.Trace
+        Contiguous piece of data
+    """
+    for path in paths:
+        st = read(path)
+        for tr in sorted(st, key=lambda tr: tr.stats.starttime):
+            yield tr
+
+
+def stream_windows(chunks, cg, sensitivity, dtype=np.float64, align=None):
+    """ Pre-processed windows from a stream of chunks
+
+    Parameters
+    ----------
+    chunks : iterable of obspy.Trace
+        Raw data, contiguous pieces sorted in time of a single channel
+    cg : crotalus.config.records.GeneralConf
+        General settings
+    sensitivity : float
+        Instrument sensitivity, to remove the response
+    dtype : numpy dtype
+        np.float32 to process in single precision
+    align : callable
+        Maps the start of a segment to the start of its first window, e.g.
+        the next window of the real-time grid. Windows start at the first
+        sample of each segment by default
+
+    Yields
+    ------
+    window : obspy.Trace
+        Pre-processed window
+    """
+    filters, windower, expected = None, None, None
+    factor = int(cg.decimation_factor)
+    for chunk in chunks:
+        sampling_rate = chunk.stats.sampling_rate / factor
+        if filters is None:
+            nyquist = .5 * sampling_rate
+            b, a    = butter(
+                cg.order, [cg.freqmin / nyquist, cg.freqmax / nyquist],
+                btype='band'
+            )
+            filters = [StreamingFilter(b, a)]
+            if factor != 1:
+                filters.insert(0, StreamingDecimator(factor))
+            windower = Windower(
+                int(round(cg.window_length * sampling_rate)),
+                int(round(cg.step * sampling_rate))
+            )
+
+        # New segment after a gap
+        gap = (
+            expected is None or
+            abs(chunk.stats.starttime - expected) > chunk.stats.delta / 2
+        )
+        data = chunk.data.astype(np.float64) / sensitivity * cg.multiple
+        if gap:
+            # The decimator passes a constant through, the bandpass sees x0
+            for f in filters:
+                f.reset(data[0])
+            starttime = chunk.stats.starttime + SETTLE_CYCLES / cg.freqmin
+            if align is not None:
+                starttime = align(starttime)
+            windower.reset(
+                starttime,
+                int(round((starttime - chunk.stats.starttime) * sampling_rate))
+            )
+        expected = chunk.stats.endtime + chunk.stats.delta
+
+        for f in filters:
+            data = f(data)
+        data = data.astype(dtype, copy=False)
+
+        starttimes, windows = windower(data, sampling_rate)
+        for starttime, window in zip(starttimes, windows):
+            yield Trace(
+                data=window,
+                header=dict(
+                    network=chunk.stats.network,
+                    station=chunk.stats.station,
+                    location=chunk.stats.location,
+                    channel=chunk.stats.channel,
+                    sampling_rate=sampling_rate,
+                    starttime=starttime
+                )
+            )
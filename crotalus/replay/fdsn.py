@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Local FDSN stand-in serving stored miniSEED
+
+Implements the subset of the FDSN web services used by crotalus-rt:
+
+    /fdsnws/dataselect/1/query
+    /fdsnws/station/1/query
+
+Data is only served up to the current time of a `Clock`, so a replay sees
+the stored waveforms arrive as they would in real time, at any speed.
+
+Stations can be cloned to simulate larger networks: a clone serves the
+waveforms and the response of its source station under a new code.
+
+Clients must be created without service discovery:
+>>> Client('http://localhost:8080', _discover_services=False)
+
+"""
+# Python Standard Library
+from copy import deepcopy
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import logging
+from threading import Thread
+from urllib.parse import parse_qs, urlparse
+
+# Other dependencies
+from obspy import Inventory, Stream, UTCDateTime
+
+# Local files
+
+
+def clone_channels(st, n_channels):
+    """ Channels to serve, cloning the stored stations as needed
+
+    Parameters
+    ----------
+    st : obspy.Stream
+        Stored waveforms
+    n_channels : int
+        Number of channels to serve, at least the stored ones are served
+
+    Returns
+    -------
+    channels : list of tuple
+        (network, station, location, channel, source_station)
+    """
+    stored = sorted({
+        (tr.stats.network, tr.stats.station, tr.stats.location,
+         tr.stats.channel)
+        for tr in st
+    })
+    channels = [(n, s, l, c, s) for n, s, l, c in stored]
+    i = 0
+    while len(channels) < n_channels:
+        n, s, l, c = stored[i % len(stored)]
+        channels.append((n, f'R{i:04d}', l, c, s))
+        i += 1
+    return channels
+
+
+class FDSNStandIn:
+    """ FDSN dataselect and station stand-in
+
+    Parameters
+    ----------
+    st : obspy.Stream
+        Stored waveforms
+    inventory : obspy.Inventory
+        Stored station metadata, with responses
+    channels : list of tuple
+        Served channels, see `clone_channels`
+    clock : crotalus.rt.clock.Clock
+        Replay clock
+    host : str
+        Address to bind
+    port : int
+        Port to bind
+    """
+    def __init__(self, st, inventory, channels, clock, host='127.0.0.1',
+                 port=8080):
+        self.st        = st
+        self.inventory = inventory
+        self.channels  = channels
+        self.clock     = clock
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin._handle(self)
+
+            def log_message(self, format, *args):
+                logging.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def select(self, params):
+        """Served channels matching the query parameters"""
+        selected = []
+        for channel in self.channels:
+            if all(
+                _match(value, params.get(key, '*'))
+                for key, value in zip(
+                    ['network', 'station', 'location', 'channel'], channel
+                )
+            ):
+                selected.append(channel)
+        return selected
+
+    def dataselect(self, params):
+        starttime = UTCDateTime(params['starttime'])
+        endtime   = min(UTCDateTime(params['endtime']), self.clock.now())
+        if endtime <= starttime:
+            return None
+
+        st = Stream()
+        for network, station, location, channel, source in self.select(params):
+            _st = self.st.select(
+                network=network, station=source, location=location,
+                channel=channel
+            ).slice(starttime, endtime).copy()
+            for tr in _st:
+                tr.stats.station = station
+            st += _st
+        if len(st) == 0:
+            return None
+
+        buf = io.BytesIO()
+        st.write(buf, format='MSEED')
+        return buf.getvalue()
+
+    def station(self, params):
+        networks = []
+        for network, station, location, channel, source in self.select(params):
+            inv = deepcopy(self.inventory.select(
+                network=network, station=source, location=location,
+                channel=channel
+            ))
+            for net in inv:
+                for sta in net:
+                    sta.code = station
+            networks += inv.networks
+        if len(networks) == 0:
+            return None
+
+        buf = io.BytesIO()
+        Inventory(networks=networks, source='crotalus-replay').write(
+            buf, format='STATIONXML'
+        )
+        return buf.getvalue()
+
+    def _handle(self, request):
+        url    = urlparse(request.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        params = {_PARAMETER_ALIASES.get(k, k): v for k, v in params.items()}
+
+        if url.path == '/fdsnws/dataselect/1/query':
+            body = self.dataselect(params)
+            content_type = 'application/vnd.fdsn.mseed'
+        elif url.path == '/fdsnws/station/1/query':
+            body = self.station(params)
+            content_type = 'application/xml'
+        else:
+            request.send_error(404)
+            return
+
+        if body is None:
+            request.send_response(204)
+            request.end_headers()
+            return
+        request.send_response(200)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+_PARAMETER_ALIASES = {
+    'net': 'network',
+    'sta': 'station',
+    'loc': 'location',
+    'cha': 'channel',
+    'start': 'starttime',
+    'end': 'endtime'
+}
+
+
+def _match(value, patterns):
+    """FDSN matching: comma separated list of wildcards, '--' is empty"""
+    for pattern in patterns.split(','):
+        if pattern == '--':
+            pattern = ''
+        if fnmatch(value, pattern):
+            return True
+    return False
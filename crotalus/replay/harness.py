@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Replay harness to load-test the real-time pipeline
+
+Runs crotalus-rt against the local FDSN stand-in (crotalus.replay.fdsn) and a
+local PostgreSQL database, with a sped-up clock, and measures:
+
+    - sustained windows per second written to the continuous table
+    - end-to-end lag: replay clock time minus the end of the last window
+      written, in replay seconds
+    - per-stage cost, from the timings logged by crotalus-rt
+
+Use a scratch database: the channel table is rewritten with the replayed
+channels.
+
+"""
+# Python Standard Library
+import json
+import logging
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from threading import Thread
+import time
+
+# Other dependencies
+import numpy as np
+from obspy import UTCDateTime
+
+# Local files
+
+
+TIMINGS = re.compile(
+    r'Timings: windows (\d+), download ([\d.]+) s, pre_process ([\d.]+) s, '
+    r'features ([\d.]+) s, write ([\d.]+) s'
+)
+STAGES = ['download', 'pre_process', 'features', 'write']
+
+
+def setup_channels(conn, channels):
+    """ Replace the continuous extraction channels by the replayed ones
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection to a scratch database
+    channels : list of tuple
+        (network, station, location, channel, source_station)
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute('UPDATE channel SET continuous_extraction = false;')
+        for network, station, location, channel, source in channels:
+            c.execute(
+                """
+                UPDATE channel SET continuous_extraction = true
+                WHERE network = %s AND station = %s AND channel = %s;
+                """,
+                (network, station, channel)
+            )
+            if c.rowcount == 0:
+                c.execute(
+                    """
+                    INSERT INTO channel
+                        (network, station, channel, continuous_extraction)
+                    VALUES (%s, %s, %s, true);
+                    """,
+                    (network, station, channel)
+                )
+
+
+def write_auth(database, host, port):
+    """ Write the crotalus-rt JSON file pointing to the stand-in
+
+    Returns
+    -------
+    path : str
+        JSON file path
+    """
+    auth = dict(
+        database=database,
+        fdsn=dict(ip=host, port=port, discover_services=False)
+    )
+    f = tempfile.NamedTemporaryFile(
+        'w', prefix='crotalus-replay-', suffix='.json', delete=False
+    )
+    with f:
+        json.dump(auth, f)
+    return f.name
+
+
+def start_rt(jsonfile, clock, rt=None):
+    """ Start crotalus-rt on the replay clock
+
+    Parameters
+    ----------
+    jsonfile : str
+        crotalus-rt JSON file, see `write_auth`
+    clock : crotalus.rt.clock.Clock
+        Replay clock
+    rt : str
+        crotalus-rt script path, found in the PATH by default
+
+    Returns
+    -------
+    process : subprocess.Popen
+        crotalus-rt process
+    timings : list of dict
+        Filled with the timings of each cycle while it runs
+    """
+    rt = rt or shutil.which('crotalus-rt')
+    process = subprocess.Popen(
+        [
+            sys.executable, rt, jsonfile,
+            '--speed', str(clock.speed),
+            '--clock-start', str(clock.start),
+            '--clock-origin', repr(clock.origin)
+        ],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+
+    timings = []
+
+    def _read():
+        for line in process.stdout:
+            logging.debug(line.rstrip())
+            match = TIMINGS.search(line)
+            if match:
+                values = [float(v) for v in match.groups()]
+                timings.append(dict(zip(['windows'] + STAGES, values)))
+
+    Thread(target=_read, daemon=True).start()
+    return process, timings
+
+
+def sample(conn, clock, since, window_length):
+    """ Rows written and lag at the current time
+
+    Returns
+    -------
+    wall : float
+        Wall clock time
+    n_rows : int
+        Rows written since `since`
+    lag : float or None
+        Replay seconds between the clock and the end of the last window
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            'SELECT count(*), max(time) FROM continuous WHERE time >= %s;',
+            (since.datetime,)
+        )
+        n_rows, last = c.fetchone()
+    lag = None
+    if last is not None:
+        lag = clock.now() - UTCDateTime(last) - window_length / 2
+    return time.time(), n_rows, lag
+
+
+def report(samples, timings, speed, n_channels):
+    """ Summary of a replay
+
+    Parameters
+    ----------
+    samples : list of tuple
+        Output of `sample` along the replay
+    timings : list of dict
+        Cycle timings logged by crotalus-rt
+    speed : float
+        Clock speed
+    n_channels : int
+        Replayed channels
+
+    Returns
+    -------
+    summary : dict
+        Replay metrics
+    """
+    (w0, n0, _), (w1, n1, _) = samples[0], samples[-1]
+    lags = [lag for _, _, lag in samples if lag is not None]
+    summary = dict(
+        speed=speed,
+        channels=n_channels,
+        wall_seconds=w1 - w0,
+        windows=n1 - n0,
+        windows_per_second=(n1 - n0) / (w1 - w0) if w1 > w0 else np.nan,
+        lag_last=lags[-1] if lags else np.nan,
+        lag_max=max(lags) if lags else np.nan
+    )
+    for stage in STAGES:
+        values = np.array([t[stage] for t in timings])
+        windows = np.array([t['windows'] for t in timings])
+        summary[f'{stage}_seconds_per_cycle'] = (
+            values.mean() if len(values) else np.nan
+        )
+        summary[f'{stage}_seconds_per_window'] = (
+            values.sum() / windows.sum() if windows.sum() else np.nan
+        )
+    return summary
+
+
+def format_report(summary):
+    return '\n'.join(
+        f'{key:>34}: {value:.4g}' if isinstance(value, float) else
+        f'{key:>34}: {value}'
+        for key, value in summary.items()
+    )
+
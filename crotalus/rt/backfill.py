@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Backfill of long time ranges with bounded memory
+
+Features of a long trace computed chunk by chunk with
+`crotalus.dsp.streaming` and written as they come:
+
+>>> chunks = iter_client_chunks(client, 'OV', 'VTUN', '*', 'HHZ', t0, t1, 3600)
+>>> rows = stream_features(chunks, cg, cf, channel_id, sensitivity)
+>>> write_stream(conn, rows)
+
+"""
+# Python Standard Library
+
+# Other dependencies
+import numpy as np
+
+# Local files
+from crotalus.dsp.streaming import stream_windows
+from crotalus.rt.clock import grid_start
+from crotalus.rt.pipeline import COLUMNS, compute_features, write_features
+
+
+def stream_features(
+    chunks, cg, cf, channel_id, sensitivity, dtype=np.float64
+):
+    """ Feature rows from a stream of chunks
+
+    Parameters
+    ----------
+    chunks : iterable of obspy.Trace
+        Raw data, see `crotalus.dsp.streaming.stream_windows`
+    cg : crotalus.config.records.GeneralConf
+        General settings
+    cf : crotalus.config.records.FeatureConf
+        Features settings
+    channel_id : int
+        Channel ID
+    sensitivity : float
+        Instrument sensitivity
+    dtype : numpy dtype
+        np.float32 to process in single precision
+
+    Yields
+    ------
+    row : tuple
+        (channel_id, time, *values), see `crotalus.rt.pipeline.COLUMNS`
+    """
+    # Windows on the real-time grid, so rows deduplicate with crotalus-rt
+    def align(t):
+        return grid_start(t, cg.window_length, cg.step)
+
+    for tr in stream_windows(chunks, cg, sensitivity, dtype, align):
+        midtime = tr.stats.starttime + cg.window_length / 2
+        values  = compute_features(tr, cg, cf)
+        yield (int(channel_id), midtime.datetime) + values
+
+
+def write_stream(conn, rows, batch_size=1000, columns=COLUMNS):
+    """ Write feature rows as they come, in batches
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    rows : iterable of tuple
+        Feature rows, see `stream_features`
+    batch_size : int
+        Rows per insert
+    columns : list of str
+        Columns of the rows, see `crotalus.rt.pipeline.feature_columns`
+
+    Returns
+    -------
+    n_rows : int
+        Rows written
+    """
+    n_rows, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            write_features(conn, batch, columns)
+            n_rows += len(batch)
+            batch = []
+    if batch:
+        write_features(conn, batch, columns)
+        n_rows += len(batch)
+    return n_rows
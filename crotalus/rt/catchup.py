@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Catch-up of the real-time processing
+
+When crotalus-rt falls behind real time (database outage, FDSN stall, slow
+cycle) processing the backlog one window at a time, with one download and one
+insert per window, can take hours. Instead the backlog is processed in batch:
+
+    1. One waveform request per channel for the whole backlog range
+    2. Pre-processing of the whole traces, segment by segment if gaps
+    3. Slicing into the real-time windows with `st2windowed_data`
+    4. Features of all the windows computed across worker processes
+    5. A single bulk insert
+
+Then crotalus-rt goes back to the normal real-time stepping.
+
+The same batch processing catches up the channels taken over from another
+crotalus-rt instance, from their last window (see crotalus.rt.coordination).
+
+Since the filters run over the whole backlog instead of over each window,
+there are no edge transients and the values differ slightly from the ones of
+the real-time path.
+
+"""
+# Python Standard Library
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import time
+
+# Other dependencies
+import numpy as np
+from obspy import Stream, Trace, UTCDateTime
+
+# Local files
+from crotalus.dsp.obspy2numpy import st2windowed_data
+from crotalus.dsp.pre_process import pre_process
+from crotalus.rt.pipeline import (
+    compute_features, feature_columns, get_channel_id, write_features
+)
+from crotalus.rt.waveserver import get_waveforms
+
+
+MAX_WINDOWS   = 1440 # Windows per catch-up batch, bounds memory
+CHUNK_WINDOWS = 32   # Windows per worker task
+
+HEARTBEAT_INTERVAL = 10 # Seconds between two heartbeats of a batch
+
+
+def lag_windows(endtime, step, now):
+    """ Number of complete windows waiting to be processed
+
+    Parameters
+    ----------
+    endtime : obspy.UTCDateTime
+        End of the next window to process
+    step : float
+        Step between windows in seconds
+    now : obspy.UTCDateTime
+        Current time
+
+    Returns
+    -------
+    n : int
+        Number of windows ending before `now`
+    """
+    if now < endtime:
+        return 0
+    return int((now - endtime) // step) + 1
+
+
+def catch_up(
+    client, conn, channels, cg, cf, starttime, endtime, now,
+    n_workers=None, max_windows=MAX_WINDOWS, dtype=np.float64,
+    statistics=None, heartbeat=None
+):
+    """ Process the backlog in batch
+
+    Parameters
+    ----------
+    client : obspy.clients.fdsn.Client
+        FDSN client
+    conn : SQL connection
+        SQL connection
+    channels : pandas.DataFrame
+        Channels to process
+    cg : crotalus.config.records.GeneralConf
+        General settings
+    cf : crotalus.config.records.FeatureConf
+        Features settings
+    starttime : obspy.UTCDateTime
+        Start of the next window to process
+    endtime : obspy.UTCDateTime
+        End of the next window to process
+    now : obspy.UTCDateTime
+        Current time
+    n_workers : int
+        Worker processes, number of CPUs by default
+    max_windows : int
+        Maximum number of windows processed in this call
+    dtype : numpy dtype
+        np.float32 to process in single precision
+    statistics : crotalus.rt.statistics.StatisticsEngine
+        Updated with the rows written, if given
+    heartbeat : callable
+        Called between the steps of the batch, at most every
+        `HEARTBEAT_INTERVAL` seconds, e.g. to renew the channel leases
+
+    Returns
+    -------
+    starttime : obspy.UTCDateTime
+        Start of the next window to process
+    endtime : obspy.UTCDateTime
+        End of the next window to process
+    """
+    n = min(lag_windows(endtime, cg.step, now), max_windows)
+    if n < 2:
+        return starttime, endtime
+
+    process_windows(
+        client, conn, channels, cg, cf, starttime, n, n_workers, dtype,
+        statistics, heartbeat
+    )
+    return starttime + n * cg.step, endtime + n * cg.step
+
+
+def catch_up_channels(
+    client, conn, channels, cg, cf, last_times, starttime, n_workers=None,
+    max_windows=MAX_WINDOWS, dtype=np.float64, statistics=None,
+    heartbeat=None
+):
+    """ Process the windows of channels missed since their last window
+
+    For channels taken over from another crotalus-rt instance, which may have
+    stopped a few windows before this one reached `starttime`.
+
+    Parameters
+    ----------
+    last_times : dict
+        Mid time (datetime.datetime or None) of the last window processed by
+        channel ID, on the grid of `starttime`. Channels without one are
+        skipped
+    starttime : obspy.UTCDateTime
+        Start of the next window this instance processes
+    max_windows : int
+        Maximum number of windows per channel, the most recent ones
+
+    See `catch_up` for the other parameters.
+    """
+    groups = {}
+    for channel_id, last_time in last_times.items():
+        if last_time is not None:
+            groups.setdefault(last_time, []).append(channel_id)
+
+    for last_time, channel_ids in sorted(groups.items()):
+        # Windows between the last one and `starttime`, on its grid
+        midtime = starttime + cg.window_length / 2
+        n = int(round((midtime - UTCDateTime(last_time)) / cg.step)) - 1
+        if n <= 0:
+            continue
+        if n > max_windows:
+            logging.warning(
+                f'{n} windows missed since {last_time}, '
+                f'only the last {max_windows} are processed'
+            )
+            n = max_windows
+        process_windows(
+            client, conn, channels[channels.id.isin(channel_ids)], cg, cf,
+            starttime - n * cg.step, n, n_workers, dtype, statistics,
+            heartbeat
+        )
+
+
+def process_windows(
+    client, conn, channels, cg, cf, starttime, n, n_workers=None,
+    dtype=np.float64, statistics=None, heartbeat=None
+):
+    """ Process consecutive windows of the real-time grid in batch
+
+    Parameters
+    ----------
+    starttime : obspy.UTCDateTime
+        Start of the first window
+    n : int
+        Number of windows
+
+    See `catch_up` for the other parameters.
+    """
+    last_endtime = starttime + cg.window_length + (n - 1) * cg.step
+    logging.info(
+        f'Catching up {n} windows, '
+        f'{str(starttime).split(".")[0]}-{str(last_endtime).split(".")[0]}...'
+    )
+
+    heartbeat = _Throttled(heartbeat)
+    st = get_waveforms(client, channels, starttime, last_endtime)
+    heartbeat()
+
+    # Gaps are likely after an outage. Merged traces would be masked, which
+    # response removal, detrend and decimation reject: pre-process each
+    # contiguous segment on its own, windows never span a gap
+    st.merge()
+    segments = Stream()
+    for tr in st.split():
+        if tr.stats.endtime - tr.stats.starttime < cg.window_length:
+            continue
+        segment = Stream([tr])
+        pre_process(
+            segment, int(cg.decimation_factor), cg.freqmin, cg.freqmax,
+            cg.order, cg.multiple, dtype=dtype
+        )
+        segments += segment
+        heartbeat()
+
+    tasks = []
+    for tr in segments:
+        channel_id = get_channel_id(channels, tr)
+        midtimes, data = _windows(tr, starttime, cg.window_length, cg.step, n)
+        header = dict(
+            network=tr.stats.network,
+            station=tr.stats.station,
+            location=tr.stats.location,
+            channel=tr.stats.channel,
+            sampling_rate=tr.stats.sampling_rate
+        )
+        for i in range(0, len(midtimes), CHUNK_WINDOWS):
+            tasks.append((
+                int(channel_id), header, cg.window_length,
+                midtimes[i:i+CHUNK_WINDOWS], data[i:i+CHUNK_WINDOWS], cg, cf
+            ))
+
+    logging.info(f'Processing {len(tasks)} tasks...')
+    rows = []
+    with ProcessPoolExecutor(n_workers or os.cpu_count()) as executor:
+        for _rows in executor.map(_compute_chunk, tasks):
+            rows += _rows
+            heartbeat()
+
+    logging.info(f'Writing {len(rows)} rows...')
+    write_features(conn, rows, feature_columns(cf))
+    if statistics is not None:
+        statistics.update(rows)
+
+
+class _Throttled:
+    """Callable calling `func` at most every HEARTBEAT_INTERVAL seconds"""
+    def __init__(self, func):
+        self.func = func
+        self.last = time.monotonic()
+
+    def __call__(self):
+        if self.func is None:
+            return
+        if time.monotonic() - self.last >= HEARTBEAT_INTERVAL:
+            self.func()
+            self.last = time.monotonic()
+
+
+def _windows(tr, starttime, window_length, step, n):
+    """Windows of a trace on the real-time grid, with their mid times"""
+    # First grid window starting inside the trace (there may be a gap)
+    k0 = max(0, int(np.ceil((tr.stats.starttime - starttime) / step - 1e-6)))
+    if k0 >= n:
+        return [], np.empty((0, 0))
+    tr = tr.slice(starttime + k0 * step, nearest_sample=True)
+
+    overlap = 1 - step / window_length
+    times, data_windowed = st2windowed_data(tr, window_length, overlap)
+    data_windowed = data_windowed[0][:n - k0]
+
+    # On the grid, so rows match the ones of the real-time path
+    t0 = starttime + window_length / 2
+    midtimes = [t0 + (k0 + k) * step for k in range(len(data_windowed))]
+    return midtimes, data_windowed
+
+
+def _compute_chunk(task):
+    channel_id, header, window_length, midtimes, data, cg, cf = task
+    rows = []
+    for midtime, window in zip(midtimes, data):
+        tr = Trace(
+            data=np.array(window),
+            header=dict(header, starttime=midtime - window_length / 2)
+        )
+        values = compute_features(tr, cg, cf)
+        rows.append((channel_id, midtime.datetime) + values)
+    return rows
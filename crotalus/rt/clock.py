@@ -0,0 +1,64 @@
+# Python Standard Library
+import math
+import time
+
+# Other dependencies
+from obspy import UTCDateTime
+
+# Local files
+
+
+class Clock:
+    """ Clock of the real-time loop
+
+    By default it is the wall clock. For replays it can start at a past time
+    and run faster than the wall clock:
+
+        now = start + (wall time - origin) * speed
+
+    Parameters
+    ----------
+    speed : float
+        Clock speed relative to the wall clock
+    start : obspy.UTCDateTime or str
+        Clock time at `origin`, defaults to the wall clock time
+    origin : float
+        Wall clock time (epoch seconds) at which the clock reads `start`,
+        defaults to now. Processes sharing a replay must share it
+    """
+    def __init__(self, speed=1, start=None, origin=None):
+        self.speed  = speed
+        self.origin = time.time() if origin is None else origin
+        self.start  = UTCDateTime(self.origin if start is None else start)
+
+    def now(self):
+        return self.start + (time.time() - self.origin) * self.speed
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed)
+
+
+def grid_start(t, window_length, step):
+    """ Start of the first window of the real-time grid starting at `t` or later
+
+    Window mid times are multiples of `step` since the epoch (whole minutes
+    for a 60 s step), so real-time, catch-up and backfill rows of a window
+    share the same time and deduplicate on (channel_id, time).
+
+    Parameters
+    ----------
+    t : obspy.UTCDateTime
+        Time
+    window_length : float
+        Window length in seconds
+    step : float
+        Step between windows in seconds
+
+    Returns
+    -------
+    starttime : obspy.UTCDateTime
+        Window start
+    """
+    mid = (t + window_length / 2).timestamp
+    k = math.ceil(mid / step - 1e-6)
+    return UTCDateTime(k * step) - window_length / 2
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Sharding of channels across several crotalus-rt instances
+
+The instances coordinate through the database, with two tables:
+
+    rt_worker : one row per live instance, with its last heartbeat
+    rt_lease  : one row per channel, with the instance owning it, until when,
+                and the mid time of the last window processed
+
+On every cycle each instance:
+
+    1. Sends a heartbeat, forgets the instances without a recent one
+    2. Renews the leases of its channels
+    3. Releases channels above its fair share, ceil(n_channels / n_workers)
+    4. Claims free or expired channels up to its fair share, using
+       SELECT ... FOR UPDATE SKIP LOCKED, so two instances never claim the
+       same channel
+
+When an instance dies its leases expire and the others claim them. When an
+instance joins, the others release their extra channels on their next cycle.
+Instances can run on one or several nodes, they only need the database.
+
+All the instances step on the same grid, anchored on the epoch (see
+`crotalus.rt.clock.grid_start`), and record the last window of their
+channels with `record_progress`. A new owner catches up from there (see
+`crotalus.rt.catchup.catch_up_channels`), so no window is lost when a
+channel changes hands, whatever the phase of the two instances.
+
+"""
+# Python Standard Library
+import math
+import os
+import socket
+
+# Other dependencies
+
+# Local files
+
+
+def get_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def create_tables(conn):
+    """ Create the coordination tables if they do not exist
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rt_worker (
+                worker_id text PRIMARY KEY,
+                heartbeat timestamptz NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rt_lease (
+                channel_id integer PRIMARY KEY,
+                worker_id  text,
+                expires    timestamptz NOT NULL DEFAULT 'epoch'
+            );
+            ALTER TABLE rt_lease ADD COLUMN IF NOT EXISTS last_time timestamp;
+            """
+        )
+
+
+def acquire_channels(conn, worker_id, channel_ids, lease):
+    """ Get the channels this instance must process in this cycle
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    worker_id : str
+        Instance identifier
+    channel_ids : list of int
+        All the channels to process
+    lease : float
+        Lease duration in seconds, a few steps. Also the time after which an
+        instance without heartbeat is considered dead
+
+    Returns
+    -------
+    owned : list of int
+        Channel IDs leased to this instance
+    """
+    channel_ids = [int(i) for i in channel_ids]
+    interval = f'{lease} seconds'
+    with conn:
+        c = conn.cursor()
+
+        c.execute(
+            """
+            INSERT INTO rt_worker (worker_id, heartbeat) VALUES (%s, now())
+            ON CONFLICT (worker_id) DO UPDATE SET heartbeat = now();
+            """,
+            (worker_id,)
+        )
+        c.execute(
+            """
+            DELETE FROM rt_worker
+            WHERE heartbeat < now() - %s::interval;
+            """,
+            (interval,)
+        )
+        c.execute('SELECT count(*) FROM rt_worker;')
+        n_workers = c.fetchone()[0]
+
+        c.execute(
+            """
+            INSERT INTO rt_lease (channel_id) SELECT unnest(%s::integer[])
+            ON CONFLICT DO NOTHING;
+            """,
+            (channel_ids,)
+        )
+        c.execute(
+            'DELETE FROM rt_lease WHERE NOT (channel_id = ANY(%s));',
+            (channel_ids,)
+        )
+
+        target = math.ceil(len(channel_ids) / max(n_workers, 1))
+
+        c.execute(
+            """
+            UPDATE rt_lease SET expires = now() + %s::interval
+            WHERE worker_id = %s
+            RETURNING channel_id;
+            """,
+            (interval, worker_id)
+        )
+        owned = sorted(row[0] for row in c.fetchall())
+
+        if len(owned) > target:
+            c.execute(
+                """
+                UPDATE rt_lease SET worker_id = NULL, expires = 'epoch'
+                WHERE channel_id = ANY(%s);
+                """,
+                (owned[target:],)
+            )
+            owned = owned[:target]
+        elif len(owned) < target:
+            c.execute(
+                """
+                UPDATE rt_lease SET
+                    worker_id = %s,
+                    expires = now() + %s::interval
+                WHERE channel_id IN (
+                    SELECT channel_id FROM rt_lease
+                    WHERE worker_id IS NULL OR expires < now()
+                    ORDER BY channel_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING channel_id;
+                """,
+                (worker_id, interval, target - len(owned))
+            )
+            owned = sorted(owned + [row[0] for row in c.fetchall()])
+    return owned
+
+
+def release_channels(conn, worker_id):
+    """ Release all the channels of an instance, on a clean shutdown
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    worker_id : str
+        Instance identifier
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            UPDATE rt_lease SET worker_id = NULL, expires = 'epoch'
+            WHERE worker_id = %s;
+            """,
+            (worker_id,)
+        )
+        c.execute('DELETE FROM rt_worker WHERE worker_id = %s;', (worker_id,))
+
+
+def renew_leases(conn, worker_id, lease):
+    """ Send a heartbeat and renew the leases of an instance
+
+    For long steps, e.g. catch-up batches, which can last longer than a
+    lease.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    worker_id : str
+        Instance identifier
+    lease : float
+        Lease duration in seconds
+    """
+    interval = f'{lease} seconds'
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            INSERT INTO rt_worker (worker_id, heartbeat) VALUES (%s, now())
+            ON CONFLICT (worker_id) DO UPDATE SET heartbeat = now();
+            """,
+            (worker_id,)
+        )
+        c.execute(
+            """
+            UPDATE rt_lease SET expires = now() + %s::interval
+            WHERE worker_id = %s;
+            """,
+            (interval, worker_id)
+        )
+
+
+def record_progress(conn, worker_id, time):
+    """ Record the last window processed for the channels of an instance
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    worker_id : str
+        Instance identifier
+    time : datetime.datetime
+        Mid time of the last window processed
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            UPDATE rt_lease SET last_time = %s
+            WHERE worker_id = %s AND
+            (last_time IS NULL OR last_time < %s);
+            """,
+            (time, worker_id, time)
+        )
+
+
+def get_last_times(conn, channel_ids):
+    """ Get the last window processed of channels, by any instance
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    channel_ids : list of int
+        Channel IDs
+
+    Returns
+    -------
+    last_times : dict
+        Mid time (datetime.datetime or None) of the last window processed
+        by channel ID
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT channel_id, last_time FROM rt_lease
+            WHERE channel_id = ANY(%s);
+            """,
+            ([int(i) for i in channel_ids],)
+        )
+        return dict(c.fetchall())
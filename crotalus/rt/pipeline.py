@@ -0,0 +1,165 @@
+# Python Standard Library
+
+# Other dependencies
+import numpy as np
+from psycopg2.extras import execute_values
+
+# Local files
+from crotalus.dsp.features import (
+    dsar, freq_central, freq_centroid, freq_domi, freq_ratio, kurtosis, rsem,
+    tonality
+)
+from crotalus.dsp.spectrum import (
+    downsample_spectrogram, spectrogram, spectrum
+)
+
+
+COLUMNS = [
+    'channel_id',
+    'time',
+    'rsem',
+    'ssam',
+    'dsar',
+    'freq_domi',
+    'freq_top_k',
+    'freq_central',
+    'freq_centroid',
+    'kurtosis',
+    'tonality',
+    'freq_ratio'
+]
+
+# Per sub-window features, written when the spectrogram option is set
+SUBWINDOW_COLUMNS = [
+    'ssam_sub',
+    'freq_domi_sub',
+    'freq_centroid_sub'
+]
+
+
+def get_channel_id(channels, tr):
+    """Channel ID of a trace, from the continuous extraction channels"""
+    return channels[
+        (channels.station == tr.stats.station) &
+        (channels.channel == tr.stats.channel)
+    ].iloc[0].id
+
+
+def feature_columns(cf):
+    """Columns of the rows computed with the features settings `cf`"""
+    if cf.spectrogram is None:
+        return COLUMNS
+    return COLUMNS + SUBWINDOW_COLUMNS
+
+
+def compute_features(tr, cg, cf):
+    """ Compute the features of a window
+
+    With the spectrogram option (`cf.spectrogram`), SSAM, dominant and
+    centroid frequencies of each sub-window are added, in the order of
+    SUBWINDOW_COLUMNS. They go in the same row, so the number of rows does
+    not change. The other columns are always computed on the whole window,
+    so their series do not change when the option is switched.
+
+    Parameters
+    ----------
+    tr : obspy.Trace
+        Pre-processed window, will be modified
+    cg : crotalus.config.records.GeneralConf
+        General settings
+    cf : crotalus.config.records.FeatureConf
+        Features settings
+
+    Returns
+    -------
+    values : tuple
+        Feature values, in the order of feature_columns(cf)[2:]
+    """
+    # Time series features
+    _rsem     = rsem(tr.data)
+    _kurtosis = kurtosis(tr.data)
+    _dsar     = dsar(tr, cf.dsar.freqmin, cf.dsar.freqmax, cf.dsar.order,
+                     tr.stats.npts/tr.stats.sampling_rate, 0)[1][0]
+
+    # Spectral features
+    f, Sx = spectrum(tr, cg.pad)
+
+    _freq_central  = freq_central(f, Sx)
+    _freq_centroid = freq_centroid(f, Sx)
+    _freq_domi     = freq_domi(f, Sx, 1)
+    _freq_ratio    = freq_ratio(f, Sx, cf.freq_ratio.freqmin, cf.freq_ratio.freqmax)
+    _freq_top_k    = freq_domi(f, Sx, cf.freq_top_k.k)
+
+    fc, _ssam      = downsample_spectrogram(
+        f, Sx, cf.ssam.f_lower, cf.ssam.f_upper, method=cf.ssam.method,
+        f_delta=cf.ssam.f_delta, fraction=cf.ssam.fraction,
+        sampling_rate=tr.stats.sampling_rate
+    )
+
+    _tonality      = tonality(f, Sx, cf.tonality.k, cf.tonality.bin_width,
+                              tr.stats.sampling_rate)
+
+    # Python floats: psycopg2 cannot adapt numpy.float32 (--float32)
+    values = (
+        float(_rsem),
+        _ssam.astype(float).tolist(),
+        float(_dsar),
+        float(_freq_domi),
+        float(_freq_top_k),
+        float(_freq_central),
+        float(_freq_centroid),
+        float(_kurtosis),
+        float(_tonality),
+        float(_freq_ratio)
+    )
+    if cf.spectrogram is None:
+        return values
+
+    # Per sub-window features, 2-D branches of the spectral features. All
+    # the sub-windows are transformed in a single batched FFT
+    times, f, Sxx = spectrogram(
+        tr, cf.spectrogram.window_length, cf.spectrogram.overlap, cg.pad
+    )
+    if Sxx.shape[0] == 0:
+        # Window shorter than a sub-window
+        return values + (None, None, None)
+    fc, ssam_sub = downsample_spectrogram(
+        f, Sxx, cf.ssam.f_lower, cf.ssam.f_upper, method=cf.ssam.method,
+        f_delta=cf.ssam.f_delta, fraction=cf.ssam.fraction,
+        sampling_rate=tr.stats.sampling_rate
+    )
+    return values + (
+        ssam_sub.tolist(),
+        freq_domi(f, Sxx, 1).tolist(),
+        freq_centroid(f, Sxx).tolist()
+    )
+
+
+def write_features(conn, rows, columns=COLUMNS):
+    """ Insert feature rows in the continuous table
+
+    All the rows go in a single statement. Rows already in the table are
+    skipped, so a window can be written twice safely, as long as the table
+    has a unique index on (channel_id, time): always for the partitioned
+    table, see `crotalus.db.schema.has_unique_index` for plain ones.
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    rows : list of tuple
+        (channel_id, time, *values), in the order of `columns`
+    columns : list of str
+        Columns of the rows, see `feature_columns`
+    """
+    with conn:
+        c = conn.cursor()
+        query = f"""
+        INSERT INTO
+            continuous ({', '.join(columns)})
+        VALUES
+            %s
+        ON CONFLICT DO NOTHING;
+        """
+        execute_values(c, query, rows)
+
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""Online statistics of the features for anomaly detection
+
+For every channel and scalar feature, each new window updates in constant
+time:
+
+    - a rolling mean and variance over the last `window` values
+    - an exponentially weighted mean and variance (long-term baseline)
+    - P² quantile estimates (Jain & Chlamtac, 1985), without storing values
+
+Before updating, every value is checked against the current baselines:
+
+    - zscore:   |value - rolling mean| / rolling std > `zscore`
+    - ratio:    value / exponentially weighted mean > `ratio`
+    - quantile: value > `margin` times the `quantile` estimate, disabled by
+                default, since a quantile is exceeded by construction
+
+An alert is written to the `alert` table when a test holds for `persistence`
+consecutive windows, once per episode, so single noisy windows of
+heavy-tailed features do not raise alerts.
+
+The state is stored in the `rt_statistics` table, so a restart does not need
+to scan the history again. Rows older than the stored state are skipped, so
+windows processed twice are counted once. With sharding, an instance saves
+and forgets the channels it hands over, and a stored state is only replaced
+by a newer one.
+
+>>> engine = StatisticsEngine(conn)
+>>> engine.update(rows) # Rows as written by crotalus.rt.pipeline
+
+"""
+# Python Standard Library
+from collections import deque
+import math
+
+# Other dependencies
+from psycopg2.extras import Json, execute_values
+
+# Local files
+from crotalus.rt.pipeline import COLUMNS
+
+
+FEATURES = [c for c in COLUMNS[2:] if c != 'ssam']
+
+SETTINGS = dict(
+    window=1440,        # Rolling window length, in windows
+    alpha=0.001,        # Exponential weight of each new value
+    quantiles=[0.5, 0.99],
+    min_count=60,       # Values before alerts are raised
+    zscore=5.,
+    ratio=3.,
+    quantile=None,      # Quantile of the exceedance alert, e.g. 0.99
+    margin=1.5,         # Factor over the quantile for the exceedance alert
+    persistence=3,      # Consecutive windows before an alert
+    persist_every=10    # Updates between two writes of the state
+)
+
+
+class RollingStats:
+    """ Mean and variance of the last `window` values
+
+    Parameters
+    ----------
+    window : int
+        Number of values
+    """
+    def __init__(self, window, values=()):
+        self.values = deque(values, maxlen=window)
+        self.sum    = math.fsum(self.values)
+        self.sum2   = math.fsum(v*v for v in self.values)
+
+    def update(self, x):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            self.sum  -= old
+            self.sum2 -= old*old
+        self.values.append(x)
+        self.sum  += x
+        self.sum2 += x*x
+
+    @property
+    def count(self):
+        return len(self.values)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else math.nan
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return math.nan
+        var = (self.sum2 - self.sum*self.sum/self.count) / (self.count - 1)
+        return math.sqrt(max(var, 0.))
+
+    def to_dict(self):
+        return dict(window=self.values.maxlen, values=list(self.values))
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['window'], d['values'])
+
+
+class EWMStats:
+    """ Exponentially weighted mean and variance
+
+    Parameters
+    ----------
+    alpha : float
+        Weight of each new value (0-1)
+    """
+    def __init__(self, alpha, mean=math.nan, var=0., count=0):
+        self.alpha = alpha
+        self.mean  = mean
+        self.var   = var
+        self.count = count
+
+    def update(self, x):
+        if self.count == 0:
+            self.mean = x
+        else:
+            diff = x - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.var   = (1 - self.alpha) * (self.var + diff * incr)
+        self.count += 1
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+    def to_dict(self):
+        return dict(
+            alpha=self.alpha, mean=self.mean, var=self.var, count=self.count
+        )
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['alpha'], d['mean'], d['var'], d['count'])
+
+
+class P2Quantile:
+    """ P² quantile estimate, five markers whatever the number of values
+
+    Jain & Chlamtac (1985)
+
+    Parameters
+    ----------
+    p : float
+        Quantile (0-1)
+    """
+    def __init__(self, p, q=None, n=None, np_=None):
+        self.p   = p
+        self.q   = q or []
+        self.n   = n or [0, 1, 2, 3, 4]
+        self.np_ = np_ or [0, 2*p, 4*p, 2 + 2*p, 4]
+        self.dn  = [0, p/2, p, (1 + p)/2, 1]
+
+    def update(self, x):
+        q, n = self.q, self.n
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i+1])
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np_[i] += self.dn[i]
+
+        for i in range(1, 4):
+            d = self.np_[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + d) * (q[i+1] - q[i]) / (n[i+1] - n[i]) +
+                    (n[i+1] - n[i] - d) * (q[i] - q[i-1]) / (n[i] - n[i-1])
+                )
+                if not q[i-1] < qp < q[i+1]:
+                    qp = q[i] + d * (q[i+d] - q[i]) / (n[i+d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    @property
+    def value(self):
+        if len(self.q) == 0:
+            return math.nan
+        if len(self.q) < 5:
+            return self.q[min(int(self.p * len(self.q)), len(self.q) - 1)]
+        return self.q[2]
+
+    def to_dict(self):
+        return dict(p=self.p, q=self.q, n=self.n, np_=self.np_)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['p'], d['q'], d['n'], d['np_'])
+
+
+class FeatureStats:
+    """ Statistics of one feature of one channel """
+    def __init__(self, settings, state=None):
+        self.settings = settings
+        if state is None:
+            self.rolling   = RollingStats(settings['window'])
+            self.ewm       = EWMStats(settings['alpha'])
+            self.quantiles = {p: P2Quantile(p) for p in settings['quantiles']}
+            self.streaks   = {}
+            self.time      = None
+        else:
+            self.rolling   = RollingStats.from_dict(state['rolling'])
+            self.ewm       = EWMStats.from_dict(state['ewm'])
+            self.quantiles = {
+                q['p']: P2Quantile.from_dict(q) for q in state['quantiles']
+            }
+            self.streaks   = state.get('streaks', {})
+            self.time      = state['time']
+
+    def check(self, x):
+        """ Alerts raised by a value against the current baselines
+
+        Counts the consecutive windows over each threshold, a test raises an
+        alert when its count reaches `persistence`. Call once per value.
+
+        Returns
+        -------
+        alerts : list of tuple
+            (kind, baseline, score)
+        """
+        s = self.settings
+        if self.rolling.count < s['min_count']:
+            return []
+
+        exceeded = {}
+        std = self.rolling.std
+        if std > 0:
+            z = abs(x - self.rolling.mean) / std
+            if z > s['zscore']:
+                exceeded['zscore'] = (self.rolling.mean, z)
+        if self.ewm.mean > 0:
+            ratio = x / self.ewm.mean
+            if ratio > s['ratio']:
+                exceeded['ratio'] = (self.ewm.mean, ratio)
+        if s['quantile'] is not None and s['quantile'] in self.quantiles:
+            q = self.quantiles[s['quantile']].value
+            if x > s['margin'] * q:
+                exceeded['quantile'] = (q, s['quantile'])
+
+        alerts = []
+        for kind in ['zscore', 'ratio', 'quantile']:
+            if kind not in exceeded:
+                self.streaks.pop(kind, None)
+                continue
+            self.streaks[kind] = self.streaks.get(kind, 0) + 1
+            if self.streaks[kind] == s['persistence']:
+                alerts.append((kind, *exceeded[kind]))
+        return alerts
+
+    def update(self, x, time):
+        self.rolling.update(x)
+        self.ewm.update(x)
+        for quantile in self.quantiles.values():
+            quantile.update(x)
+        self.time = time
+
+    def to_dict(self):
+        return dict(
+            rolling=self.rolling.to_dict(),
+            ewm=self.ewm.to_dict(),
+            quantiles=[q.to_dict() for q in self.quantiles.values()],
+            streaks=self.streaks,
+            time=self.time
+        )
+
+
+class StatisticsEngine:
+    """ Online statistics and alerts of all channels and features
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    features : list of str
+        Scalar features to follow
+    settings : dict
+        Overrides of `SETTINGS`
+    """
+    def __init__(self, conn, features=FEATURES, settings=None):
+        self.conn     = conn
+        self.features = features
+        self.settings = dict(SETTINGS, **(settings or {}))
+        self.stats    = {}
+        self.dirty    = set() # Updated since the last save
+        self.updates  = 0
+        create_tables(conn)
+        self.load()
+
+    def load(self, channel_ids=None):
+        """ Read the stored state
+
+        States updated and not saved yet are kept, so the channels taken over
+        from another instance can be reloaded at any time.
+
+        Parameters
+        ----------
+        channel_ids : list of int
+            Channels to load, all by default
+        """
+        query = 'SELECT channel_id, feature, state FROM rt_statistics'
+        with self.conn:
+            c = self.conn.cursor()
+            if channel_ids is None:
+                c.execute(query + ';')
+            else:
+                c.execute(
+                    query + ' WHERE channel_id = ANY(%s);',
+                    ([int(i) for i in channel_ids],)
+                )
+            for channel_id, feature, state in c.fetchall():
+                key = (channel_id, feature)
+                if key not in self.dirty:
+                    self.stats[key] = FeatureStats(self.settings, state)
+
+    def save(self):
+        """ Write the states updated since the last save
+
+        A stored state is only replaced by a newer one, so an instance that
+        lost a channel never overwrites the state of its new owner.
+        """
+        if not self.dirty:
+            return
+        rows = [
+            (key[0], key[1], Json(self.stats[key].to_dict()))
+            for key in sorted(self.dirty)
+        ]
+        with self.conn:
+            c = self.conn.cursor()
+            execute_values(
+                c,
+                """
+                INSERT INTO rt_statistics (channel_id, feature, state)
+                VALUES %s
+                ON CONFLICT (channel_id, feature)
+                DO UPDATE SET state = EXCLUDED.state
+                WHERE rt_statistics.state->>'time' IS NULL OR
+                (EXCLUDED.state->>'time')::timestamp >
+                (rt_statistics.state->>'time')::timestamp;
+                """,
+                rows
+            )
+        self.dirty.clear()
+
+    def release(self, channel_ids):
+        """ Save and forget the states of channels handed over
+
+        Parameters
+        ----------
+        channel_ids : list of int
+            Channels now processed by another instance
+        """
+        self.save()
+        channel_ids = {int(i) for i in channel_ids}
+        for key in [key for key in self.stats if key[0] in channel_ids]:
+            del self.stats[key]
+
+    def update(self, rows):
+        """ Check and update the statistics with new feature rows
+
+        Parameters
+        ----------
+        rows : list of tuple
+            (channel_id, time, *values), see `crotalus.rt.pipeline.COLUMNS`
+
+        Returns
+        -------
+        alerts : list of tuple
+            (channel_id, time, feature, kind, value, baseline, score)
+        """
+        alerts = []
+        for row in sorted(rows, key=lambda row: (row[0], row[1])):
+            channel_id, time = row[0], row[1]
+            for feature in self.features:
+                x = row[COLUMNS.index(feature)]
+                if x is None or not math.isfinite(x):
+                    continue
+                key = (channel_id, feature)
+                if key not in self.stats:
+                    self.stats[key] = FeatureStats(self.settings)
+                s = self.stats[key]
+                if s.time is not None and time.isoformat() <= s.time:
+                    continue
+                for kind, baseline, score in s.check(x):
+                    alerts.append(
+                        (channel_id, time, feature, kind, x, baseline, score)
+                    )
+                s.update(x, time.isoformat())
+                self.dirty.add(key)
+
+        if alerts:
+            write_alerts(self.conn, alerts)
+
+        self.updates += 1
+        if self.updates % self.settings['persist_every'] == 0:
+            self.save()
+        return alerts
+
+
+def create_tables(conn):
+    """ Create the statistics and alert tables if they do not exist
+
+    Parameters
+    ----------
+    conn : SQL connection
+        SQL connection
+    """
+    with conn:
+        c = conn.cursor()
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rt_statistics (
+                channel_id integer,
+                feature    text,
+                state      jsonb,
+                PRIMARY KEY (channel_id, feature)
+            );
+            CREATE TABLE IF NOT EXISTS alert (
+                id         serial PRIMARY KEY,
+                channel_id integer NOT NULL,
+                time       timestamp NOT NULL,
+                feature    text NOT NULL,
+                kind       text NOT NULL,
+                value      double precision,
+                baseline   double precision,
+                score      double precision
+            );
+            CREATE INDEX IF NOT EXISTS alert_channel_id_time_idx
+            ON alert (channel_id, time);
+            """
+        )
+
+
+def write_alerts(conn, alerts):
+    with conn:
+        c = conn.cursor()
+        execute_values(
+            c,
+            """
+            INSERT INTO alert
+                (channel_id, time, feature, kind, value, baseline, score)
+            VALUES %s;
+            """,
+            alerts
+        )
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Validation of the float32 processing mode
+
+Processes reference data window by window, as crotalus-rt does, once in
+float64 and once in float32, and reports the differences of every feature.
+
+>>> df = compare_precision(st, cg, cf)
+>>> print(precision_report(df))
+
+"""
+# Python Standard Library
+import time
+
+# Other dependencies
+import numpy as np
+from obspy import Stream
+import pandas as pd
+
+# Local files
+from crotalus.dsp.pre_process import pre_process
+from crotalus.rt.pipeline import compute_features, feature_columns
+
+
+def compare_precision(st, cg, cf):
+    """ Features in float64 and float32 for each window of reference data
+
+    Parameters
+    ----------
+    st : obspy.Stream
+        Raw reference waveforms, with responses attached
+    cg : crotalus.config.records.GeneralConf
+        General settings
+    cf : crotalus.config.records.FeatureConf
+        Features settings
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        One row per window and feature: float64 and float32 values, absolute
+        and relative differences. For SSAM the maximum over the bands
+    """
+    features = feature_columns(cf)[2:]
+    rows = []
+    timings = {np.float64: 0., np.float32: 0.}
+    for tr in st:
+        for window in tr.slide(cg.window_length, cg.step):
+            values = {}
+            for dtype in timings:
+                _st = Stream([window.copy()])
+                t0 = time.perf_counter()
+                pre_process(
+                    _st, int(cg.decimation_factor), cg.freqmin,
+                    cg.freqmax, cg.order, cg.multiple, dtype=dtype
+                )
+                values[dtype] = compute_features(_st[0], cg, cf)
+                timings[dtype] += time.perf_counter() - t0
+
+            for feature, v64, v32 in zip(
+                features, values[np.float64], values[np.float32]
+            ):
+                if v64 is None or v32 is None:
+                    continue
+                v64, v32 = np.asarray(v64), np.asarray(v32)
+                diff = np.abs(v64 - v32)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rel = diff / np.abs(v64)
+                rows.append(dict(
+                    id=tr.id,
+                    time=window.stats.starttime,
+                    feature=feature,
+                    float64=v64 if v64.ndim == 0 else np.nan,
+                    float32=v32 if v32.ndim == 0 else np.nan,
+                    abs_diff=diff.max(),
+                    rel_diff=np.nanmax(rel)
+                ))
+
+    df = pd.DataFrame(rows)
+    df.attrs['seconds_float64'] = timings[np.float64]
+    df.attrs['seconds_float32'] = timings[np.float32]
+    return df
+
+
+def precision_report(df):
+    """ Summary of `compare_precision` per feature
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Output of `compare_precision`
+
+    Returns
+    -------
+    report : str
+        Table of absolute and relative differences per feature, and the
+        processing time in each precision
+    """
+    summary = df.groupby('feature').agg(
+        windows=('rel_diff', 'size'),
+        max_abs_diff=('abs_diff', 'max'),
+        median_rel_diff=('rel_diff', 'median'),
+        max_rel_diff=('rel_diff', 'max')
+    ).reindex(df.feature.unique())
+    return (
+        summary.to_string(float_format='{:.3e}'.format) + '\n\n'
+        f'Processing time float64: {df.attrs["seconds_float64"]:.2f} s\n'
+        f'Processing time float32: {df.attrs["seconds_float32"]:.2f} s'
+    )
@@ -0,0 +1,48 @@
+# Python Standard Library
+import logging
+from threading import Thread
+
+# Other dependencies
+from obspy import Stream
+from obspy.clients.fdsn import Client
+
+# Local files
+
+
+def connect_waveserver(ip, port, discover_services=True):
+    url = f'http://{ip}:{port}'
+    try:
+        logging.info(f'Connecting to {url}...')
+        client = Client(url, _discover_services=discover_services)
+        logging.info('Succesfully connected to FDSN client.\n')
+        return client
+    except Exception as e:
+        logging.info(e)
+
+
+def get_waveforms(client, channels, starttime, endtime):
+    def _get_waveform(network, station, channel, starttime, endtime):
+        nonlocal st
+        st += client.get_waveforms(
+            network, station, '*', channel,
+            starttime, endtime, attach_response=True
+        )
+
+    threads, st = [], Stream()
+    for i, row in channels.iterrows():
+        thread = Thread(
+            target=_get_waveform,
+            args=(
+                row.network,
+                row.station,
+                row.channel,
+                starttime,
+                endtime
+            )
+        )
+        threads.append(thread)
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+    return st
@@ -1,15 +1,19 @@
 # Python Standard Library
+from datetime import datetime, timedelta
 
 # Other dependencies
+import dash
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
+import pandas as pd
 
 # Local files
 from crotalus.web.apps import app
 from crotalus.web.queries import (
-    get_channel_options, query, get_client, get_network
+    get_channel_options, query, query_channels, query_new, get_client,
+    get_network
 )
-from crotalus.web.plots import plot
+from crotalus.web.plots import plot, plot_channels, ssam_images
 
 
 @app.callback(
@@ -30,26 +34,214 @@ def set_channel_options(selected_station):
     Output('channel-dropdown', 'value'),
     Input('channel-dropdown', 'options'))
 def set_channel_value(available_options):
-    return available_options[0]['value']
+    return [available_options[0]['value']]
 
 
 @app.callback(
     Output('loading', 'children'),
     Output('graph', 'figure'),
+    Output('plot-store', 'data'),
 
-    [Input('submit-button', 'n_clicks')],
+    [
+        Input('submit-button', 'n_clicks'),
+        Input('graph', 'relayoutData')
+    ],
 
-    state=[
-        State('channel-dropdown', 'value'),
-        State('measurement-checklist', 'value'),
-        State('datetime-picker', 'startDate'),
-        State('datetime-picker', 'endDate')
-    ]
+    State('channel-dropdown', 'value'),
+    State('channel-dropdown', 'options'),
+    State('measurement-checklist', 'value'),
+    State('datetime-picker', 'startDate'),
+    State('datetime-picker', 'endDate'),
+    State('plot-store', 'data')
 )
-def update_output_div(n_clicks, channel_id, measurements, startDate, endDate):
-    if n_clicks is None:
+def update_output_div(
+    n_clicks, relayout, channel_ids, channel_options, measurements, startDate,
+    endDate, plotted
+):
+    if n_clicks is None or not channel_ids:
         raise PreventUpdate
+
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    if 'graph.relayoutData' in triggered:
+        # Pan/zoom: only send the SSAM tiles now visible, the browser keeps
+        # the rest of the figure. From what is plotted, the selection may
+        # have changed since the last Submit
+        if plotted is None or not plotted['ssam']:
+            raise PreventUpdate
+        xrange = _relayout_xrange(relayout)
+        if xrange is None:
+            xrange = [
+                pd.to_datetime(plotted[key]).to_pydatetime()
+                for key in ['starttime', 'endtime']
+            ]
+        patch = dash.Patch()
+        patch['layout']['images'] = ssam_images(
+            plotted['measurements'], plotted['channel_ids'][0], *xrange
+        )
+        return None, patch, dash.no_update
+
+    starttime = pd.to_datetime(startDate).to_pydatetime()
+    endtime   = pd.to_datetime(endDate).to_pydatetime()
+
+    if len(channel_ids) > 1:
+        # Comparison view: SSAM is one row per channel, not supported
+        measurements = [m for m in measurements if m != 'ssam']
+        if len(measurements) == 0:
+            raise PreventUpdate
+
+    if len(channel_ids) == 1:
+        # SSAM is drawn from tiles, do not download the matrix
+        channel_id = channel_ids[0]
+        columns = [m for m in measurements if m != 'ssam']
+        df = query(channel_id, columns, startDate, endDate)
+        fig = plot(measurements, df, channel_id, starttime, endtime)
+        traces = [
+            (i, m, channel_id) for i, m in enumerate(measurements)
+            if m != 'ssam'
+        ]
     else:
-        df = query(channel_id, measurements, startDate, endDate)
-        return None, plot(measurements, df)
+        labels = {o['value']: o['label'] for o in channel_options}
+        df = query_channels(channel_ids, measurements, startDate, endDate)
+        fig = plot_channels(measurements, df, labels)
+        traces = [
+            (i, m, channel_id) for i, (m, channel_id) in enumerate(df.columns)
+        ]
+    # Keep the zoom across the updates of this figure, reset it on Submit
+    fig.update_layout(uirevision=n_clicks)
+
+    # What the live mode needs to extend this figure. Channels are written
+    # at different times, each one has its own last plotted time
+    times = {}
+    for channel_id in channel_ids:
+        if len(channel_ids) == 1:
+            index = df.index
+        else:
+            index = df.xs(int(channel_id), axis=1, level=1).dropna(
+                how='all'
+            ).index
+        if len(index) > 0:
+            times[str(channel_id)] = str(index[-1])
+    # Channels without rows start at the latest plotted time, so a silent
+    # channel does not make every update read the whole range again
+    latest = max(times.values(), key=pd.Timestamp, default=str(starttime))
+    for channel_id in channel_ids:
+        times.setdefault(str(channel_id), latest)
+    plotted = dict(
+        n_clicks=n_clicks,
+        channel_ids=channel_ids,
+        traces=[(i, m, int(channel_id)) for i, m, channel_id in traces],
+        times=times,
+        max_points=max(len(df), 1),
+        ssam=len(channel_ids) == 1 and 'ssam' in measurements,
+        measurements=measurements,
+        starttime=str(starttime),
+        endtime=str(endtime)
+    )
+    return None, fig, plotted
+
+
+@app.callback(
+    Output('live-interval', 'disabled'),
+    Input('live-checklist', 'value'))
+def set_live(value):
+    return 'live' not in value
+
+
+@app.callback(
+    Output('graph', 'extendData'),
+    Output('live-store', 'data'),
+    Input('live-interval', 'n_intervals'),
+    State('plot-store', 'data'),
+    State('live-store', 'data')
+)
+def extend_graph(n_intervals, plotted, live):
+    """Append only the rows written since the last update, per channel"""
+    if plotted is None:
+        raise PreventUpdate
+
+    # A new Submit resets the live state
+    if live is None or live['n_clicks'] != plotted['n_clicks']:
+        live = dict(
+            n_clicks=plotted['n_clicks'], times=dict(plotted['times'])
+        )
+
+    traces = plotted['traces']
+    if len(traces) == 0:
+        raise PreventUpdate
+
+    # One query from the channel lagging the most, then each channel keeps
+    # only the rows after its own last plotted time
+    times = {
+        channel_id: pd.Timestamp(t) for channel_id, t in live['times'].items()
+    }
+    measurements = list(dict.fromkeys(m for i, m, channel_id in traces))
+    df = query_new(
+        plotted['channel_ids'], measurements, str(min(times.values()))
+    )
+    new = {
+        channel_id: df[(df.channel_id == int(channel_id)) & (df.time > t)]
+        for channel_id, t in times.items()
+    }
+    if all(len(rows) == 0 for rows in new.values()):
+        raise PreventUpdate
+
+    for channel_id, rows in new.items():
+        if len(rows) > 0:
+            live['times'][channel_id] = str(rows.time.iloc[-1])
+    data = dict(
+        x=[new[str(channel_id)].time.tolist() for i, m, channel_id in traces],
+        y=[new[str(channel_id)][m].tolist() for i, m, channel_id in traces]
+    )
+    indices = [i for i, m, channel_id in traces]
+    # Keep the plotted time range length constant
+    return (data, indices, plotted['max_points']), live
+
+
+@app.callback(
+    Output('graph', 'figure', allow_duplicate=True),
+    Input('live-interval', 'n_intervals'),
+    State('plot-store', 'data'),
+    State('graph', 'relayoutData'),
+    prevent_initial_call=True
+)
+def refresh_tiles(n_intervals, plotted, relayout):
+    """ Request the SSAM tiles again in live mode
+
+    New windows are drawn in the open tiles and new tiles appear as time
+    goes by. The open tiles have a new URL every TILE_REFRESH seconds (see
+    `tiles.tile_images`), so the browser fetches them again.
+    """
+    if plotted is None or not plotted['ssam']:
+        raise PreventUpdate
+
+    # The zoomed range if any, else the plotted range moved to now
+    xrange = _relayout_xrange(relayout)
+    if xrange is not None:
+        starttime, endtime = xrange
+    else:
+        starttime = pd.to_datetime(plotted['starttime']).to_pydatetime()
+        endtime   = pd.to_datetime(plotted['endtime']).to_pydatetime()
+        shift     = max(datetime.utcnow() - endtime, timedelta(0))
+        starttime, endtime = starttime + shift, endtime + shift
+
+    patch = dash.Patch()
+    patch['layout']['images'] = ssam_images(
+        plotted['measurements'], plotted['channel_ids'][0], starttime, endtime
+    )
+    return patch
+
 
+def _relayout_xrange(relayout):
+    """Visible time range from the graph relayoutData, None if autorange"""
+    if not relayout:
+        return None
+    for key, value in relayout.items():
+        if key.startswith('xaxis') and key.endswith('.range[0]'):
+            axis = key.split('.')[0]
+            return (
+                pd.to_datetime(value).to_pydatetime(),
+                pd.to_datetime(relayout[f'{axis}.range[1]']).to_pydatetime()
+            )
+        if key.startswith('xaxis') and key.endswith('.range'):
+            return tuple(pd.to_datetime(v).to_pydatetime() for v in value)
+    return None
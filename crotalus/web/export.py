@@ -0,0 +1,46 @@
+# Python Standard Library
+
+# Other dependencies
+from flask import Response, request
+import pandas as pd
+import psycopg2
+
+# Local files
+from crotalus.db.export import iter_ipc
+from crotalus.web.apps import app
+
+
+# Connection parameters, set by crotalus-web. Each export opens its own
+# connection: the server-side cursor keeps a transaction open while the
+# response streams, which must not block the shared connection
+DATABASE = None
+
+
+def _iter_ipc(channel_ids, starttime, endtime, measurements):
+    export_conn = psycopg2.connect(**DATABASE)
+    try:
+        yield from iter_ipc(
+            export_conn, channel_ids, starttime, endtime, measurements
+        )
+    finally:
+        export_conn.close()
+
+
+@app.server.route('/export/features.arrow')
+def export_features():
+    """ Stream features as an Arrow IPC stream
+
+    /export/features.arrow?channel_id=1&channel_id=2&starttime=...&endtime=...
+    Optional: measurement=rsem&measurement=dsar
+    """
+    channel_ids  = request.args.getlist('channel_id', type=int)
+    measurements = request.args.getlist('measurement') or None
+    starttime    = pd.to_datetime(request.args['starttime']).to_pydatetime()
+    endtime      = pd.to_datetime(request.args['endtime']).to_pydatetime()
+    return Response(
+        _iter_ipc(channel_ids, starttime, endtime, measurements),
+        mimetype='application/vnd.apache.arrow.stream',
+        headers={
+            'Content-Disposition': 'attachment; filename=features.arrow'
+        }
+    )
@@ -2,8 +2,7 @@
 from datetime import datetime, timedelta
 
 # Other dependencies
-import dash_core_components as dcc
-import dash_html_components as html
+from dash import dcc, html
 from dash_datetimepicker import DashDatetimepicker
 
 # Local files
@@ -11,6 +10,8 @@ from crotalus.web.apps import app
 from crotalus.web.queries import get_volcanoes_options, get_measurments_options
 
 
+volcanoes_options = get_volcanoes_options()
+
 layout = html.Div(
     id='output',
     children=[
@@ -18,13 +19,13 @@ layout = html.Div(
 
         dcc.Dropdown(
             id='volcano-dropdown',
-            options=get_volcanoes_options(),
-            value=get_volcanoes_options()[0]['value']
+            options=volcanoes_options,
+            value=volcanoes_options[0]['value'] if volcanoes_options else None
         ),
 
         html.Label('Channel'),
 
-        dcc.Dropdown(id='channel-dropdown'),
+        dcc.Dropdown(id='channel-dropdown', multi=True),
 
         html.Label('Measurements'),
 
@@ -43,11 +44,22 @@ layout = html.Div(
 
         html.Button('Submit', id='submit-button'),
 
+        dcc.Checklist(
+            id='live-checklist',
+            options=[dict(label='Live', value='live')],
+            value=[]
+        ),
+
         dcc.Loading(
             id="loading",
             fullscreen=True,
         ),
 
-        dcc.Graph(id='graph')
+        dcc.Graph(id='graph'),
+
+        # Live mode: append new rows to the graph with extendData
+        dcc.Interval(id='live-interval', interval=60*1000, disabled=True),
+        dcc.Store(id='plot-store'),
+        dcc.Store(id='live-store')
     ]
 )
@@ -6,21 +6,78 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 # Local files
-from crotalus.web.queries import get_ssam_freq
+from crotalus.web.queries import get_ssam_bands
+from crotalus.web.tiles import tile_images
 
 
-fl = get_ssam_freq()
-
-
-def plot(measurements, df):
+def plot(measurements, df, channel_id, starttime, endtime):
     fig = make_subplots(rows=len(measurements), cols=1, shared_xaxes=True,)
     for row, m in enumerate(measurements, start=1):
-        trace = go.Scatter(x=df.index, y=df[m], mode='lines', name=m)
         if m == 'ssam':
-            Sxx = np.array(df.ssam.tolist()).T # Hacer la matriz
-            trace = go.Heatmap(x=df.index, y=fl, z=np.log(Sxx))
-            fig.update_yaxes(type="log", row=row, col=1)
+            # Pre-rendered tiles as layout images, the axis is log10(f)
+            fl, fc, fu = get_ssam_bands()
+            trace = go.Scatter(x=[starttime, endtime], y=[None, None], name=m)
+            xref, yref = _axes_ref(row)
+            for image in tile_images(channel_id, starttime, endtime, xref, yref):
+                fig.add_layout_image(image)
+            ticks = [f for f in [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50]
+                     if fl[0] <= f <= fu[-1]]
+            fig.update_yaxes(
+                range=[np.log10(fl[0]), np.log10(fu[-1])],
+                tickvals=np.log10(ticks), ticktext=ticks, row=row, col=1
+            )
+        else:
+            trace = go.Scatter(x=df.index, y=df[m], mode='lines', name=m)
         fig.add_trace(trace, row=row, col=1)
 
         fig.update_layout(height=len(measurements)*300)
     return fig
+
+
+def plot_channels(measurements, df, labels):
+    """ Compare channels on a shared time axis
+
+    One row per measurement, one trace per channel. SSAM is not supported.
+
+    Parameters
+    ----------
+    measurements : list of str
+        Measurements to plot
+    df : pandas.DataFrame
+        Columns (measurement, channel_id), see `queries.query_channels`
+    labels : dict
+        Channel ID to trace name
+
+    Returns
+    -------
+    fig : plotly.graph_objects.Figure
+        Figure
+    """
+    fig = make_subplots(
+        rows=len(measurements), cols=1, shared_xaxes=True,
+        subplot_titles=measurements
+    )
+    for row, m in enumerate(measurements, start=1):
+        for channel_id in df[m].columns:
+            trace = go.Scatter(
+                x=df.index, y=df[m][channel_id], mode='lines',
+                name=labels.get(channel_id, str(channel_id)),
+                legendgroup=str(channel_id), showlegend=(row == 1),
+                connectgaps=True
+            )
+            fig.add_trace(trace, row=row, col=1)
+
+    fig.update_layout(height=len(measurements)*300)
+    return fig
+
+
+def ssam_images(measurements, channel_id, starttime, endtime):
+    """Layout images of the SSAM tiles of a figure for a new time range"""
+    xref, yref = _axes_ref(measurements.index('ssam') + 1)
+    return tile_images(channel_id, starttime, endtime, xref, yref)
+
+
+def _axes_ref(row):
+    if row == 1:
+        return 'x', 'y'
+    return f'x{row}', f'y{row}'
@@ -1,61 +1,59 @@
 # Python Standard Library
+from functools import lru_cache
+import time
 
 # Other dependencies
 import pandas as pd
 
 # Local files
-from crotalus.config.database import get_configuration
-from crotalus.dsp.spectrum import get_8ve_bands
+from crotalus.config.cache import ConfigCache
+
+
+_config_cache = None
+
+
+def get_config_cache():
+    """Configuration cache of the web interface, loaded on first use"""
+    global _config_cache
+    if _config_cache is None:
+        _config_cache = ConfigCache(conn)
+    return _config_cache
 
 
 def get_volcanoes_options():
-    df = pd.read_sql_query('SELECT * FROM volcano;', conn)
-    return [dict(label=row['volcano'], value=row.id) for i, row in df.iterrows()]
+    volcanoes = get_config_cache().get().volcanoes
+    return [
+        dict(label=row.volcano, value=row.id)
+        for row in volcanoes.itertuples()
+    ]
 
 
 def get_channel_options(volcano_id):
-    df = pd.read_sql_query(
-        f"""
-        SELECT
-             channel.id, channel.station, channel.channel
-        FROM
-            channel
-        INNER JOIN
-            station
-        ON
-            channel.station_id = station.id
-        WHERE
-            channel.continuous_extraction AND
-            station.volcano_id = {volcano_id};
-        """,
-        conn
-    )
+    config = get_config_cache().get()
+    channels = config.continuous_extraction_channels()
+    if len(channels) == 0 or volcano_id is None:
+        return []
+    station_ids = config.stations.id[config.stations.volcano_id == volcano_id]
+    channels = channels[channels.station_id.isin(station_ids)]
     return [
         dict(label=f'{row.station}-{row.channel}', value=row.id)
-        for i, row in df.iterrows()
+        for row in channels.itertuples()
     ]
 
 def get_measurments_options():
-    df = pd.read_sql_query(
-        """
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_NAME = N'continuous'
-        """,
-        conn
-    )
+    # Per sub-window columns are arrays, not plotted
     return [
-        dict(label=row.column_name, value=row.column_name)
-        for i, row in df.iterrows()
-        if row.column_name not in ['channel_id', 'time']
+        dict(label=column, value=column)
+        for column in get_config_cache().get().measurements
+        if not column.endswith('_sub')
     ]
 
 
 def query(channel_id, measurements, starttime, endtime):
-    measurements_str = ', '.join(measurements)
+    columns_str = ', '.join(['time'] + list(measurements))
     df = pd.read_sql_query(
         f"""
-        SELECT time, {measurements_str} FROM continuous
+        SELECT {columns_str} FROM continuous
         WHERE (channel_id = '{channel_id}') AND
         (time BETWEEN timestamp '{starttime}' and timestamp '{endtime}');
         """,
@@ -66,10 +64,107 @@ def query(channel_id, measurements, starttime, endtime):
     return df
 
 
+def query_channels(channel_ids, measurements, starttime, endtime):
+    """ Query several channels in a single statement
+
+    Parameters
+    ----------
+    channel_ids : list of int
+        Channel IDs
+    measurements : list of str
+        Columns of the continuous table
+    starttime : str
+        Start of the time range
+    endtime : str
+        End of the time range
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Indexed by time, columns (measurement, channel_id). Channels are aligned
+        on a shared time axis, missing values are NaN
+    """
+    columns_str = ', '.join(['channel_id', 'time'] + list(measurements))
+    df = pd.read_sql_query(
+        f"""
+        SELECT {columns_str} FROM continuous
+        WHERE (channel_id = ANY(%s)) AND
+        (time BETWEEN %s AND %s);
+        """,
+        conn,
+        params=([int(c) for c in channel_ids], starttime, endtime)
+    )
+    return _pivot(df, channel_ids, measurements)
+
+
+@lru_cache(maxsize=256)
+def _query_new(channel_ids, measurements, after, ttl_hash):
+    columns_str = ', '.join(('channel_id', 'time') + measurements)
+    df = pd.read_sql_query(
+        f"""
+        SELECT {columns_str} FROM continuous
+        WHERE (channel_id = ANY(%s)) AND
+        (time > %s);
+        """,
+        conn,
+        params=(list(channel_ids), after)
+    )
+    df['time'] = pd.to_datetime(df.time, unit='s')
+    return df.drop_duplicates(['time', 'channel_id']).sort_values('time')
+
+
+def query_new(channel_ids, measurements, after, ttl=60):
+    """ Query the rows written after a given time
+
+    Used by the live mode. Results are shared for `ttl` seconds between all
+    the clients asking for the same rows, so many screens open on the same
+    channels cost a single query per interval.
+
+    Parameters
+    ----------
+    channel_ids : list of int
+        Channel IDs
+    measurements : list of str
+        Columns of the continuous table
+    after : str
+        Time of the oldest last row already plotted among the channels
+    ttl : float
+        Seconds the result is reused
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        New rows sorted by time, one per (channel_id, time), with the columns
+        channel_id, time and the measurements. Channels are not aligned, each
+        one has its own last plotted time
+    """
+    ttl_hash = int(time.time() // ttl)
+    return _query_new(
+        tuple(int(c) for c in channel_ids), tuple(measurements), after,
+        ttl_hash
+    )
+
+
+def _pivot(df, channel_ids, measurements):
+    df['time'] = pd.to_datetime(df.time, unit='s')
+    df = df.drop_duplicates(['time', 'channel_id']).pivot(
+        index='time', columns='channel_id', values=list(measurements)
+    )
+    df = df.reindex(
+        columns=pd.MultiIndex.from_product(
+            [list(measurements), [int(c) for c in channel_ids]]
+        )
+    )
+    df.sort_index(inplace=True)
+    return df
+
+
+def get_ssam_bands():
+    return get_config_cache().ssam_bands()
+
+
 def get_ssam_freq():
-    SAMPLING_RATE = 50
-    c = get_configuration('ssam', conn)
-    fl, fc, fu = get_8ve_bands(SAMPLING_RATE, c.fraction, c.f_lower, c.f_upper)
+    fl, fc, fu = get_ssam_bands()
     return fl
 
 ###############################################################################
@@ -81,8 +176,6 @@ def get_client(ip, port):
     return
 
 def get_network(station_id):
-    df = pd.read_sql_query(
-        f'SELECT * FROM station WHERE id = {station_id};', conn
-    )
-    return [row.network for i, row in df.iterrows()][0]
+    stations = get_config_cache().get().stations
+    return stations[stations.id == station_id].iloc[0].network
 
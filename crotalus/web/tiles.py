@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""Pre-rendered SSAM image tiles
+
+Sending the full SSAM matrix to the browser as a heatmap is too heavy for
+long time ranges. Instead the SSAM is rendered server-side into PNG tiles of
+fixed width (TILE_WIDTH columns), at several zoom levels, and cached on disk.
+
+Tiles are addressed by (channel_id, zoom, x):
+    - zoom 0 is the coarsest level, each zoom level halves the seconds per
+      column, MAX_ZOOM has BASE_RESOLUTION seconds per column.
+    - x is the tile index counted from the Unix epoch.
+
+The frequency axis is not tiled: SSAM only has a few tens of octave bands, so
+each tile covers the whole band range, one pixel row per band.
+
+Tiles are built as a pyramid: only the MAX_ZOOM tiles are computed from the
+database rows, each coarser tile is built from the two tiles below it. The
+tile data (sums and counts of log(SSAM) per column) is cached next to the
+PNG images, so coarse levels never read the rows again. The MAX_ZOOM tiles
+missing below a requested tile are computed from a single query over their
+time range.
+
+Rows arrive after their time: crotalus-rt writes a window half a window
+length after its mid time, catch-up writes the windows missed during an
+outage later. So a tile is final, and never rendered again, only when it was
+rendered FINAL_DELAY seconds after its end. Tiles still open are rendered
+again after TILE_REFRESH seconds, so they grow incrementally as new windows
+are written: only the open MAX_ZOOM tiles read the new rows, the open tiles
+above them are rebuilt from the cache. Backfills older than FINAL_DELAY
+clear the cache of their channel (see crotalus-backfill).
+
+"""
+# Python Standard Library
+from datetime import datetime
+import io
+import os
+import tempfile
+import time
+
+# Other dependencies
+from flask import request, send_file
+from matplotlib.image import imsave
+import numpy as np
+
+# Local files
+from crotalus.web.apps import app
+from crotalus.web.queries import get_ssam_bands, query
+
+
+CACHE_DIR       = os.path.join(tempfile.gettempdir(), 'crotalus-tiles')
+TILE_WIDTH      = 256  # Columns per tile
+BASE_RESOLUTION = 60   # Seconds per column at MAX_ZOOM
+MAX_ZOOM        = 12
+TILE_REFRESH    = 60   # Seconds before an open tile is rendered again
+FINAL_DELAY     = 86400 # Seconds after its end before a tile is final
+SCREEN_WIDTH    = 1500 # Approximate graph width in pixels
+CMAP            = 'viridis'
+VMIN, VMAX      = -5, 5 # Color limits in log(SSAM)
+
+
+def tile_span(zoom):
+    """Tile time span in seconds for a zoom level"""
+    return TILE_WIDTH * BASE_RESOLUTION * 2**(MAX_ZOOM - zoom)
+
+
+def choose_zoom(starttime, endtime):
+    """ Choose the zoom level to display a time range
+
+    Takes the coarsest level with at least one column per screen pixel.
+
+    Parameters
+    ----------
+    starttime : datetime.datetime
+        Start of the visible range
+    endtime : datetime.datetime
+        End of the visible range
+
+    Returns
+    -------
+    zoom : int
+        Zoom level
+    """
+    seconds = (endtime - starttime).total_seconds()
+    for zoom in range(MAX_ZOOM + 1):
+        if seconds / (tile_span(zoom) / TILE_WIDTH) >= SCREEN_WIDTH:
+            return zoom
+    return MAX_ZOOM
+
+
+def visible_tiles(starttime, endtime):
+    """ Get the tiles covering a time range
+
+    Parameters
+    ----------
+    starttime : datetime.datetime
+        Start of the visible range
+    endtime : datetime.datetime
+        End of the visible range
+
+    Returns
+    -------
+    zoom : int
+        Zoom level
+    xs : range
+        Tile indices
+    """
+    zoom = choose_zoom(starttime, endtime)
+    span = tile_span(zoom)
+    first = int(_timestamp(starttime) // span)
+    last  = int(_timestamp(endtime) // span)
+    return zoom, range(first, last + 1)
+
+
+def tile_data(channel_id, zoom, x):
+    """ Get the log(SSAM) sums and counts of the columns of a tile
+
+    MAX_ZOOM tiles are computed from the database rows, the others from the
+    two tiles of the next zoom level. Cached, like the images. The MAX_ZOOM
+    tiles missing below a tile are read in a single query.
+
+    Parameters
+    ----------
+    channel_id : int
+        Channel ID
+    zoom : int
+        Zoom level
+    x : int
+        Tile index
+
+    Returns
+    -------
+    sums : np.ndarray
+        Sum of log(SSAM), shape (n_bands, TILE_WIDTH)
+    counts : np.ndarray
+        Number of windows, shape (TILE_WIDTH,)
+    """
+    path = _data_path(channel_id, zoom, x)
+    if x * tile_span(zoom) <= time.time() and _is_fresh(
+        path, (x + 1) * tile_span(zoom)
+    ):
+        return _load(path)
+    _update_leaves(channel_id, zoom, x)
+    return _build(channel_id, zoom, x)
+
+
+def _build(channel_id, zoom, x):
+    """Tile data from the cache, the MAX_ZOOM tiles being up to date"""
+    fl, fc, fu = get_ssam_bands()
+    span = tile_span(zoom)
+    if x * span > time.time():
+        # Not started yet
+        return np.zeros((len(fc), TILE_WIDTH)), np.zeros(TILE_WIDTH)
+
+    path = _data_path(channel_id, zoom, x)
+    if zoom == MAX_ZOOM or _is_fresh(path, (x + 1) * span):
+        return _load(path)
+
+    # Each column is two columns of the next level
+    halves = [_build(channel_id, zoom + 1, 2*x + i) for i in (0, 1)]
+    sums = np.concatenate([h[0] for h in halves], axis=1)
+    sums = sums.reshape(len(sums), TILE_WIDTH, 2).sum(axis=2)
+    counts = np.concatenate([h[1] for h in halves])
+    counts = counts.reshape(TILE_WIDTH, 2).sum(axis=1)
+    _save(path, sums, counts)
+    return sums, counts
+
+
+def _update_leaves(channel_id, zoom, x):
+    """Compute the missing or open MAX_ZOOM tiles below a tile at once"""
+    n    = 2**(MAX_ZOOM - zoom)
+    span = tile_span(MAX_ZOOM)
+    now  = time.time()
+    stale = [
+        leaf for leaf in range(x * n, (x + 1) * n)
+        if leaf * span <= now and not _is_fresh(
+            _data_path(channel_id, MAX_ZOOM, leaf), (leaf + 1) * span
+        )
+    ]
+    if not stale:
+        return
+
+    fl, fc, fu = get_ssam_bands()
+    first = stale[0]
+    sums, counts = _query_tiles(
+        channel_id, first, stale[-1] - first + 1, len(fc)
+    )
+    for leaf in stale:
+        i = (leaf - first) * TILE_WIDTH
+        _save(
+            _data_path(channel_id, MAX_ZOOM, leaf),
+            sums[:, i:i+TILE_WIDTH], counts[i:i+TILE_WIDTH]
+        )
+
+
+def render_tile(channel_id, zoom, x, vmin=VMIN, vmax=VMAX):
+    """ Render a SSAM tile
+
+    Averages the log(SSAM) rows falling in each tile column. Columns without
+    data are transparent.
+
+    Parameters
+    ----------
+    channel_id : int
+        Channel ID
+    zoom : int
+        Zoom level
+    x : int
+        Tile index
+    vmin, vmax : float
+        Color limits in log(SSAM)
+
+    Returns
+    -------
+    png : bytes
+        PNG image, shape (n_bands, TILE_WIDTH)
+    """
+    sums, counts = tile_data(channel_id, zoom, x)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = sums / counts
+    z[:, counts == 0] = np.nan
+
+    buf = io.BytesIO()
+    imsave(buf, z[::-1], cmap=CMAP, vmin=vmin, vmax=vmax, format='png')
+    return buf.getvalue()
+
+
+def get_tile(channel_id, zoom, x, vmin=VMIN, vmax=VMAX):
+    """ Get the path of a cached tile, rendering it if needed
+
+    Parameters
+    ----------
+    channel_id : int
+        Channel ID
+    zoom : int
+        Zoom level
+    x : int
+        Tile index
+    vmin, vmax : float
+        Color limits in log(SSAM)
+
+    Returns
+    -------
+    path : str
+        PNG file path
+    """
+    path = os.path.join(
+        CACHE_DIR, str(channel_id), f'{vmin:g}_{vmax:g}', str(zoom), f'{x}.png'
+    )
+    if not _is_fresh(path, (x + 1) * tile_span(zoom)):
+        _write(path, render_tile(channel_id, zoom, x, vmin, vmax))
+    return path
+
+
+def tile_images(channel_id, starttime, endtime, xref, yref):
+    """ Layout images for the tiles covering a time range
+
+    The y axis where the images are placed must be linear in log10(frequency).
+    Open tiles get a query string changing every TILE_REFRESH seconds, so
+    browsers fetch them again instead of using their cached copy.
+
+    Parameters
+    ----------
+    channel_id : int
+        Channel ID
+    starttime : datetime.datetime
+        Start of the visible range
+    endtime : datetime.datetime
+        End of the visible range
+    xref : str
+        Plotly x axis reference, e.g. 'x2'
+    yref : str
+        Plotly y axis reference, e.g. 'y2'
+
+    Returns
+    -------
+    images : list of dict
+        Plotly layout images
+    """
+    fl, fc, fu = get_ssam_bands()
+    zoom, xs   = visible_tiles(starttime, endtime)
+    span       = tile_span(zoom)
+
+    images = []
+    for x in xs:
+        source = f'/tiles/ssam/{channel_id}/{zoom}/{x}.png'
+        if not _is_final((x + 1) * span, time.time()):
+            # Open tile, a new URL when it may have been rendered again
+            source += f'?v={int(time.time() // TILE_REFRESH)}'
+        images.append(
+            dict(
+                source=source,
+                xref=xref,
+                yref=yref,
+                x=datetime.utcfromtimestamp(x * span).isoformat(),
+                y=np.log10(fu[-1]),
+                sizex=span * 1000, # Date axes are in milliseconds
+                sizey=np.log10(fu[-1]) - np.log10(fl[0]),
+                xanchor='left',
+                yanchor='top',
+                sizing='stretch',
+                layer='below'
+            )
+        )
+    return images
+
+
+@app.server.route('/tiles/ssam/<int:channel_id>/<int:zoom>/<int:x>.png')
+def serve_ssam_tile(channel_id, zoom, x):
+    vmin = request.args.get('vmin', VMIN, type=float)
+    vmax = request.args.get('vmax', VMAX, type=float)
+    return send_file(
+        get_tile(channel_id, zoom, x, vmin, vmax), mimetype='image/png'
+    )
+
+
+def _query_tiles(channel_id, first, n_tiles, n_bands):
+    """ Sums and counts of log(SSAM) per column of consecutive MAX_ZOOM tiles
+
+    From the database rows, in a single query. Columns of the tiles one after
+    the other, shapes (n_bands, n_tiles * TILE_WIDTH) and
+    (n_tiles * TILE_WIDTH,)
+    """
+    span       = tile_span(MAX_ZOOM)
+    resolution = span / TILE_WIDTH
+    t0         = first * span
+    t1         = t0 + n_tiles * span
+
+    df = query(
+        channel_id, ['ssam'],
+        datetime.utcfromtimestamp(t0), datetime.utcfromtimestamp(t1)
+    )
+
+    sums   = np.zeros((n_bands, n_tiles * TILE_WIDTH))
+    counts = np.zeros(n_tiles * TILE_WIDTH)
+    if len(df) > 0:
+        seconds = df.index.values.astype('datetime64[s]').astype(np.int64) - t0
+        inside  = seconds < t1 - t0
+        columns = (seconds[inside] // resolution).astype(int)
+        Sxx     = np.log(np.array(df.ssam[inside].tolist())).T
+        np.add.at(sums, (slice(None), columns), Sxx)
+        np.add.at(counts, columns, 1)
+    return sums, counts
+
+
+def _data_path(channel_id, zoom, x):
+    return os.path.join(
+        CACHE_DIR, str(channel_id), 'data', str(zoom), f'{x}.npz'
+    )
+
+
+def _load(path):
+    with np.load(path) as f:
+        return f['sums'], f['counts']
+
+
+def _save(path, sums, counts):
+    buf = io.BytesIO()
+    np.savez(buf, sums=sums, counts=counts)
+    _write(path, buf.getvalue())
+
+
+def _is_final(tile_end, rendered):
+    """Whether a tile rendered at a given time has all its rows"""
+    return rendered > tile_end + FINAL_DELAY
+
+
+def _is_fresh(path, tile_end):
+    """Whether a cached file is final or was rendered recently"""
+    if not os.path.exists(path):
+        return False
+    rendered = os.path.getmtime(path)
+    return (
+        _is_final(tile_end, rendered) or time.time() - rendered < TILE_REFRESH
+    )
+
+
+def _write(path, data):
+    """Write and rename, so concurrent requests never read a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _timestamp(t):
+    return (t - datetime(1970, 1, 1)).total_seconds()
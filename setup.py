@@ -18,7 +18,12 @@ setup(
     install_requires = [
     ],
     scripts          = [
-        'bin/crotalus-rt'
+        'bin/crotalus-backfill',
+        'bin/crotalus-export',
+        'bin/crotalus-replay',
+        'bin/crotalus-rt',
+        'bin/crotalus-schema',
+        'bin/crotalus-validate-float32',
         'bin/crotalus-web'
     ],
     zip_safe         = False
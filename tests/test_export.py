@@ -0,0 +1,65 @@
+# Python Standard Library
+from datetime import datetime
+
+# Other dependencies
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local files
+import crotalus.db.export as export
+
+
+MEASUREMENTS = ['rsem', 'ssam']
+
+
+def _batches(conn, channel_ids, starttime, endtime, measurements=None):
+    schema = export.get_schema(MEASUREMENTS)
+    rows = [
+        (1, datetime(2021, 1, 31, 23, 59), 1., [1., 2.]),
+        (1, datetime(2021, 2, 1, 0, 0), 2., None),
+        (2, datetime(2021, 1, 31, 23, 59), 3., [1., 2., 3.])
+    ]
+    yield pa.RecordBatch.from_arrays(
+        [
+            pa.array([row[i] for row in rows], type=field.type)
+            for i, field in enumerate(schema)
+        ],
+        schema=schema
+    )
+
+
+def _empty(conn, channel_ids, starttime, endtime, measurements=None):
+    return iter([])
+
+
+def _patch(monkeypatch, read_batches):
+    monkeypatch.setattr(export, 'read_batches', read_batches)
+    monkeypatch.setattr(
+        export, 'get_feature_columns', lambda conn: MEASUREMENTS
+    )
+
+
+def test_parquet_round_trip(monkeypatch, tmp_path):
+    _patch(monkeypatch, _batches)
+    n_rows = export.write_parquet(None, [1, 2], None, None, str(tmp_path))
+
+    table = pq.read_table(str(tmp_path)).to_pandas()
+    table['channel_id'] = table.channel_id.astype(int)
+    table = table.sort_values(['channel_id', 'time'])
+    assert n_rows == len(table) == 3
+    assert table.channel_id.tolist() == [1, 1, 2]
+    assert table.month.astype(str).tolist() == ['2021-01', '2021-02', '2021-01']
+    assert table.rsem.tolist() == [1., 2., 3.]
+
+
+def test_empty_ipc_has_a_schema(monkeypatch, tmp_path):
+    _patch(monkeypatch, _empty)
+    path = str(tmp_path / 'features.arrow')
+    assert export.write_ipc(None, [1], None, None, path) == 0
+    with pa.ipc.open_stream(path) as reader:
+        assert reader.schema == export.get_schema(MEASUREMENTS)
+        assert reader.read_all().num_rows == 0
+
+    stream = b''.join(export.iter_ipc(None, [1], None, None))
+    with pa.ipc.open_stream(stream) as reader:
+        assert reader.read_all().num_rows == 0
@@ -0,0 +1,94 @@
+# Python Standard Library
+
+# Other dependencies
+import numpy as np
+from obspy import Trace, UTCDateTime
+from scipy.signal import butter, lfilter
+
+# Local files
+from crotalus.config.records import GeneralConf
+from crotalus.dsp.streaming import (
+    StreamingDecimator, StreamingFilter, stream_windows
+)
+from crotalus.rt.clock import grid_start
+
+
+SAMPLING_RATE = 100.
+
+CG = GeneralConf(
+    window_length=60., step=30., pad=0.2, decimation_factor=2, freqmin=0.5,
+    freqmax=10., order=4, multiple=1.
+)
+
+
+def _chunks(data, starttime, chunk_pts):
+    for i in range(0, len(data), chunk_pts):
+        yield Trace(
+            data=data[i:i+chunk_pts],
+            header=dict(
+                station='TEST', channel='HHZ', sampling_rate=SAMPLING_RATE,
+                starttime=starttime + i / SAMPLING_RATE
+            )
+        )
+
+
+def _data(npts, seed=0):
+    rng = np.random.default_rng(seed)
+    return 1e3 + np.cumsum(rng.standard_normal(npts))
+
+
+def test_filter_chunked_equals_single_pass():
+    b, a = butter(4, [0.02, 0.2], btype='band')
+    data = _data(10000)
+
+    f = StreamingFilter(b, a)
+    chunked = np.concatenate([f(data[i:i+777]) for i in range(0, 10000, 777)])
+
+    np.testing.assert_allclose(chunked, lfilter(b, a, data))
+
+
+def test_decimator_chunked_equals_single_pass():
+    data = _data(10000)
+
+    single = StreamingDecimator(3)(data)
+    d = StreamingDecimator(3)
+    chunked = np.concatenate([d(data[i:i+101]) for i in range(0, 10000, 101)])
+
+    np.testing.assert_allclose(chunked, single)
+
+
+def test_windows_do_not_depend_on_chunk_length():
+    starttime = UTCDateTime(2021, 1, 1, 0, 0, 7.5)
+    data = _data(int(SAMPLING_RATE * 3600))
+
+    results = []
+    for chunk_pts in [len(data), 36000, 12345]:
+        windows = list(
+            stream_windows(_chunks(data, starttime, chunk_pts), CG, 1.)
+        )
+        results.append(windows)
+
+    reference = results[0]
+    assert len(reference) > 0
+    for windows in results[1:]:
+        assert len(windows) == len(reference)
+        for tr, ref in zip(windows, reference):
+            assert tr.stats.starttime == ref.stats.starttime
+            np.testing.assert_allclose(tr.data, ref.data, rtol=1e-9, atol=1e-12)
+
+
+def test_windows_after_gap_are_on_the_grid():
+    starttime = UTCDateTime(2021, 1, 1, 0, 0, 7.5)
+    data = _data(int(SAMPLING_RATE * 1800))
+    chunks = list(_chunks(data, starttime, 36000))
+    chunks[2].stats.starttime += 13.3 # Gap
+
+    def align(t):
+        return grid_start(t, CG.window_length, CG.step)
+
+    windows = list(stream_windows(chunks, CG, 1., align=align))
+    assert len(windows) > 0
+    for tr in windows:
+        midtime = tr.stats.starttime + CG.window_length / 2
+        r = midtime.timestamp / CG.step % 1
+        assert min(r, 1 - r) < 1e-6